@@ -21,6 +21,8 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 
 job_file = 'CrystalReader_JOBS.txt'
+# Number of processes shared by all the jobs. With more than 1, independent jobs run at the same time, each one with the 'workers' of its line, but no more than this number in total. Set to 'auto' to use all the CPUs
+max_workers = 1
 
 
 
@@ -39,56 +41,47 @@ except:
     print("  ------------------------------------------------------------")
     print("")
     exit()
-try:
-    import pandas as pd
-except:
-    print("")
-    print("  ------------------------------------------------------------")
-    print("  ERROR:  Could not import the pandas module")
-    print("  Perform 'pip install --user pandas' to install it")
-    print("  Closing...")
-    print("  ------------------------------------------------------------")
+
+
+# The jobs only run when this file is executed, and not when it is imported by the parallel workers
+if __name__ == '__main__':
+
+    print("\n")
+    print("  --------------------------------------------------------------------------")
+    print("  Welcome to CrystalReader version " + cr.version())
+    print("  This is free software, and you are welcome to")
+    print("  redistribute it under GNU General Public License.")
+    print("  You should have already configured the '" + job_file + "' batch file")
+    print("  and the data headers in the scripts, else check the documentation.")
+    print("  --------------------------------------------------------------------------")
+    print("  If you find this code useful, a citation would be awesome :D")
+    print("  Pablo Gila-Herranz. “CrystalReader”, 2023. https://github.com/pablogila/CrystalReader")
+    print("  --------------------------------------------------------------------------")
     print("")
-    exit()
+    #print("  Conversion factors:")
+    #print("  cm^-1 to eV =", cr.cm_ev())
+    #print("  eV to kJ/mol =", cr.ev_kjmol())
+    #print("")
+    time_start = time.time()
+
+
+    cr.jobs(job_file, cr.read_workers(str(max_workers)))
 
 
+    ##############################################################
+    #  EXAMPLES FOR CALLING THE SCRIPTS WITHOUT A BATCH JOB FILE
+    ##############################################################
+    # First, uncomment the import castep, cif and phonon lines at the top of this file
+    # Default values to call are listed in the examples. This follows the same structure as the batch job file.
+    # Other parameters can be modified from within the scripts.
+    #
+    # castep.main(data_directory='data', data_castep='cc-2.castep', out='out_castep.csv', out_error='errors_castep.txt')
+    # cif.main(data_directory='data', data_cif='cc-2-out.cif', out='out_cif.csv', out_error='errors_cif.txt')
+    # phonon.main(data_directory='data', data_phonon='cc-2_PhonDOS.phonon', out='out_phonon.csv', out_error='errors_phonon.txt')
+    ##############################################################
 
-print("\n")
-print("  --------------------------------------------------------------------------")
-print("  Welcome to CrystalReader version " + cr.version())
-print("  This is free software, and you are welcome to")
-print("  redistribute it under GNU General Public License.")
-print("  You should have already configured the '" + job_file + "' batch file")
-print("  and the data headers in the scripts, else check the documentation.")
-print("  --------------------------------------------------------------------------")
-print("  If you find this code useful, a citation would be awesome :D")
-print("  Pablo Gila-Herranz. “CrystalReader”, 2023. https://github.com/pablogila/CrystalReader")
-print("  --------------------------------------------------------------------------")
-print("")
-#print("  Conversion factors:")
-#print("  cm^-1 to eV =", cr.cm_ev())
-#print("  eV to kJ/mol =", cr.ev_kjmol())
-#print("")
-time_start = time.time()
-
-
-cr.jobs(job_file)
-
-
-##############################################################
-#  EXAMPLES FOR CALLING THE SCRIPTS WITHOUT A BATCH JOB FILE
-##############################################################
-# First, uncomment the import castep, cif and phonon lines at the top of this file
-# Default values to call are listed in the examples. This follows the same structure as the batch job file.
-# Other parameters can be modified from within the scripts.
-#
-# castep.main(data_directory='data', data_castep='cc-2.castep', out='out_castep.csv', out_error='errors_castep.txt')
-# cif.main(data_directory='data', data_cif='cc-2-out.cif', out='out_cif.csv', out_error='errors_cif.txt')
-# phonon.main(data_directory='data', data_phonon='cc-2_PhonDOS.phonon', out='out_phonon.csv', out_error='errors_phonon.txt')
-##############################################################
-
-
-print("")
-print("  All jobs finished in", round(time.time() - time_start, 1), "seconds\n")
-print("")
+
+    print("")
+    print("  All jobs finished in", round(time.time() - time_start, 1), "seconds\n")
+    print("")
 
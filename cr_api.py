@@ -0,0 +1,113 @@
+"""
+CrystalReader API. Read castep, cif and phonon files from your own Python scripts into tables, without writing any file or printing anything.
+Copyright (C) 2023  Pablo Gila-Herranz
+If you find this code useful, a citation would be awesome :D
+Pablo Gila-Herranz, “CrystalReader”, 2023. https://github.com/pablogila/CrystalReader
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import os
+import io
+import functools
+import cr_common as cr
+import cr_table
+import cr_castep as castep
+import cr_cif as cif
+import cr_phonon as phonon
+
+
+# Usage, from your own scripts:
+# import cr_api
+# table = cr_api.read_castep(['data/struct-1/cc-2.castep', 'data/struct-2/cc-2.castep'], fields=['energy', 'space_group'])
+# df = table.to_dataframe()
+# The settings that are not given, such as the 'safemode', are the ones set in the script of each format. A 'budget' of seconds can be given for all the files, besides the 'cry' seconds of each file set in the scripts
+
+
+# Read the .castep 'files', given as an iterable of paths or of open file objects, and return a cr_table.Table with a row for each file, or a pandas DataFrame if dataframe=True.
+# The columns are the 'fields' of cr_castep.py, its 'default_fields' if not given, and only the part of the end of the files within the 'window' is searched, as set in cr_castep.py by default
+def read_castep(files, fields=None, window=None, safemode=None, workers=1, errors=None, dataframe=False, budget=None):
+    if fields is None:
+        fields = castep.default_fields
+    unknown = [field for field in fields if field not in castep.castep_fields]
+    if unknown:
+        raise ValueError("unknown castep fields: " + ", ".join(unknown) + ". The available fields are: " + ", ".join(castep.castep_fields))
+    if window is None:
+        window = cr.Window(castep.tail_window, castep.tail_step, castep.tail_cap)
+    settings = {'window': window, 'safemode': castep.safemode if safemode is None else safemode, 'fields': list(fields), 'cry': castep.cry}
+    return read_files(castep.read_file, settings, files, castep.make_header(fields), castep.make_types(fields), workers, errors, dataframe, budget)
+
+
+# Read the .cif 'files', as read_castep(). The columns are the 'header' of cr_cif.py, or the values of the 'tags', if given, as with the 'tags' of cif jobs
+def read_cif(files, tags=None, safemode=None, workers=1, errors=None, dataframe=False, budget=None):
+    settings = {'cry': cif.cry, 'safemode': cif.safemode if safemode is None else safemode, 'tags': tags}
+    return read_files(cif.read_file, settings, files, cif.make_header(tags), cif.make_types(tags), workers, errors, dataframe, budget)
+
+
+# Read the .phonon 'files', as read_castep(). The columns are the 'header' of cr_phonon.py
+def read_phonon(files, safemode=None, workers=1, errors=None, dataframe=False, budget=None):
+    settings = {'cry': phonon.cry, 'safemode': phonon.safemode if safemode is None else safemode, 'threshold': phonon.threshold, 'data_lines_phonon': phonon.data_lines_phonon}
+    return read_files(phonon.read_file, settings, files, phonon.header, phonon.types, workers, errors, dataframe, budget)
+
+
+# Read all the 'files' with the read_file() function of a format, returning a cr_table.Table with the 'header' and 'types' of the format, or a pandas DataFrame if dataframe=True.
+# The files are read in parallel if workers > 1, which only works with paths, since the file objects can not be sent to other processes: if any of the files is a file object, all of them are read in this process.
+# The files that are missing, as well as the files whose values were all discarded, such as the ones discarded by the safemode, give no row. If a list is given as 'errors', the errors found are added to it, as they are written to the error logs. Requires NumPy
+def read_files(reader, settings, files, header, types, workers=1, errors=None, dataframe=False, budget=None):
+    if cr.numpy() is None:
+        raise ImportError("NumPy is needed to keep the rows in a table. Perform 'pip install --user numpy'")
+    if budget:
+        settings = dict(settings, budget=cr.Deadline(budget))
+    items = [(file, file_name(file, number)) for number, file in enumerate(files)]
+    if any(hasattr(file, 'read') for file, name in items):
+        workers = 1
+    table = cr_table.Table(header, types)
+    for row, row_errors in cr.pool_map(functools.partial(read_item, reader=reader, settings=settings), items, workers):
+        if errors is not None:
+            errors.extend(row_errors)
+        # Rows with only the filename have no values
+        if row is not None and len(row) > 1:
+            table.append(row)
+    if dataframe:
+        return table.to_dataframe()
+    return table
+
+
+# Value of the 'filename' column of a file: its path, or the 'name' of a file object, or its number in the list of files if it has no name
+def file_name(file, number):
+    if hasattr(file, 'read'):
+        return str(getattr(file, 'name', number))
+    return os.fspath(file)
+
+
+# Read a single file for read_files(). Missing files give no row, as in the main() functions
+def read_item(item, reader, settings):
+    file, name = item
+    if hasattr(file, 'read'):
+        file = binary_file(file)
+    else:
+        file = os.fspath(file)
+        if not cr.file_exists(file):
+            return None, [[name, 'missing file']]
+    return reader(file, name, **settings)
+
+
+# File object that can be searched from its end: a seekable binary file. Text files, and files that can not be seeked such as pipes, are read into memory
+def binary_file(file):
+    if isinstance(file.read(0), str):
+        return io.BytesIO(file.read().encode())
+    if not file.seekable():
+        return io.BytesIO(file.read())
+    return file
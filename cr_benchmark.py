@@ -0,0 +1,671 @@
+"""
+CrystalReader Benchmarks. Measure the performance of the CrystalReader functions on synthetic data.
+Copyright (C) 2023  Pablo Gila-Herranz
+If you find this code useful, a citation would be awesome :D
+Pablo Gila-Herranz, “CrystalReader”, 2023. https://github.com/pablogila/CrystalReader
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import os
+import re
+import sys
+import time
+import tempfile
+import functools
+import collections
+import json
+import shutil
+import cr_common as cr
+import cr_corpus as corpus
+import cr_castep as castep
+import cr_phonon as phonon
+import cr_table
+
+
+##################################################################
+#                PARAMETERS THAT YOU MAY MODIFY
+##################################################################
+# Folder where the synthetic files are written. They are deleted after each benchmark
+bench_directory = tempfile.gettempdir()
+# Sizes of the synthetic files, in MB, for the 'searcher' benchmark. Can be overriden from the command line
+searcher_sizes = [10, 100, 1000]
+# Seconds before giving up with the old byte-by-byte searcher, as it can take ages on big files
+reference_limit = 120
+# Sizes of the synthetic files, in MB, for the 'mmap' benchmark
+mmap_sizes = [0.004, 0.016, 0.064, 0.25, 1, 4, 16, 64, 256]
+# Number of repetitions of each measurement, the best time is kept
+repetitions = 5
+# Number of modes of the synthetic files for the 'phonon' benchmark
+phonon_modes = [144, 1000, 5000]
+# Number of calls of each extract function for the 'extract' benchmark
+extract_calls = 100000
+# Seconds added to each stat and open of the stand-in filesystem, for the 'prefetch' benchmark
+prefetch_latencies = [0.001, 0.005, 0.02]
+# Number of prefetch threads to compare, 0 to read without prefetching
+prefetch_depths = [0, 4, 16, 64]
+# Number of folders with a '.castep' file of 'prefetch_file_size' bytes, for the 'prefetch' benchmark
+prefetch_folders = 200
+prefetch_file_size = 100000
+# Sizes of the synthetic files, in MB, for the 'bytes' benchmark
+bytes_sizes = [1, 10, 100]
+# Numbers of folders of the synthetic corpus for the 'suite' benchmark, written by cr_corpus.py. Can be overriden from the command line
+suite_folders = [200]
+# File where the results of the 'suite' benchmark are added, to compare the runs over time
+suite_file = 'cr_benchmark_suite.json'
+# Modules imported in a fresh interpreter for the 'startup' benchmark. Can be overriden from the command line
+startup_modules = ['cr_common', 'cr_cif', 'cr_castep', 'cr_phonon', 'cr_folder']
+# Milliseconds above which the import of a module is reported as too slow
+startup_limit = 100
+# Number of slowest imported modules listed for each one
+startup_slowest = 5
+# Numbers of rows kept in memory for the 'table' benchmark. Can be overriden from the command line
+table_rows = [1000000]
+##################################################################
+# Usage, from the command line:
+# python cr_benchmark.py searcher [size_MB size_MB ...]
+# python cr_benchmark.py mmap [size_MB size_MB ...]
+# python cr_benchmark.py phonon [modes modes ...]
+# python cr_benchmark.py extract [calls]
+# python cr_benchmark.py prefetch [latency_s latency_s ...]
+# python cr_benchmark.py startup [module module ...]
+# python cr_benchmark.py bytes [size_MB size_MB ...]
+# python cr_benchmark.py suite [folders folders ...]
+# python cr_benchmark.py table [rows rows ...]
+
+
+# One LBFGS iteration of a synthetic '.castep' file
+def castep_iteration(iteration):
+    lines = []
+    lines.append(" ================================================================================")
+    lines.append(" Starting LBFGS iteration          " + str(iteration) + " ... with trial guess (lambda=  1.000000)")
+    lines.append(" ================================================================================")
+    lines.append("")
+    lines.append("                           -------------------------------")
+    lines.append("                                      Unit Cell")
+    lines.append("                           -------------------------------")
+    lines.append("                       Lattice parameters(A)       Cell Angles")
+    lines.append("                    a =      4.807521          alpha =   90.000000")
+    lines.append("                    b =      4.807521          beta  =   90.000000")
+    lines.append("                    c =      5.807521          gamma =  120.000000")
+    lines.append("")
+    lines.append("                       Current cell volume =           106.744432       A**3")
+    lines.append("                                   density =             2.331418   AMU/A**3")
+    lines.append("                                           =             3.871392     g/cm^3")
+    lines.append("")
+    for k in range(1, 31):
+        lines.append("      " + str(k).rjust(4) + "  -1.23456789E+003   0.00000000E+000   1.23456789E-002       " + str(k*7).rjust(6) + ".00   <-- SCF")
+    lines.append("")
+    lines.append(" Final energy, E             =  -1234.567890123     eV")
+    lines.append(" Final free energy (E-TS)    =  -1234.567890123     eV")
+    lines.append(" Total energy corrected for finite basis set =  -1234.5678" + str(iteration % 10) + "     eV")
+    lines.append("")
+    lines.append(" LBFGS: finished iteration     " + str(iteration) + " with enthalpy= -1.23456789E+003 eV")
+    lines.append("")
+    return "\n".join(lines) + "\n"
+
+
+# Write a synthetic '.castep' file of approximately 'size' bytes. The 'Space group of crystal' line is only written at the top, so looking for it means scanning the whole file
+def synthetic_castep(filename, size):
+    header = " +-------------------------------------------------+\n Space group of crystal =  62: Pnma, -P 2ac 2n\n\n"
+    footer = " LBFGS: Final Enthalpy     = -1.23456789E+003 eV\n\n Total time          =        12345.67 s\n"
+    with open(filename, 'w') as f:
+        f.write(header)
+        written = len(header)
+        iteration = 1
+        while written < size:
+            chunk = castep_iteration(iteration)
+            f.write(chunk)
+            written += len(chunk)
+            iteration += 1
+        f.write(footer)
+
+
+# Old searcher, walking the file backwards one byte at a time. Kept as a reference to compare with
+def searcher_bytewise(filename, search_value, time_limit=False, number_rows=0):
+    with open(filename, 'r') as file:
+        file.seek(0, 2)
+        position = file.tell()
+        lines = []
+        time_start = time.time()
+        while position >= 0 and len(lines) < number_rows+1:
+            if time_limit and time.time() - time_start > time_limit:
+                return None
+            file.seek(position)
+            next_char = file.read(1)
+            if next_char == '\n':
+                line = file.readline().strip()
+                if line.startswith(search_value):
+                    if number_rows == 0:
+                        return line
+                    lines.append(line)
+                    for i in range(number_rows):
+                        next_line = file.readline().strip()
+                        if next_line:
+                            lines.append(next_line)
+                    break
+            position -= 1
+    return None if not lines else lines[::1]
+
+
+# Time a function call, returning the result and the elapsed seconds
+def timed(function, *args):
+    time_start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - time_start
+
+
+# Compare the block-buffered searcher with the old byte-by-byte one, for the last lines of the file and for a full scan
+def bench_searcher(sizes=searcher_sizes):
+    print("")
+    print("  Benchmarking 'searcher' against the old byte-by-byte searcher")
+    print("  Reference time limit:", reference_limit, "s")
+    print("")
+    print("  {:>8}  {:<28}  {:>12}  {:>12}  {:>8}".format('size', 'search', 'bytewise [s]', 'blocks [s]', 'speedup'))
+    searches = [('density =', 1), ('Total energy corrected', 0), ('Space group of crystal', 0)]
+    for size in sizes:
+        filename = os.path.join(bench_directory, 'cr_benchmark_' + str(size) + 'MB.castep')
+        synthetic_castep(filename, size * 1024 * 1024)
+        try:
+            for search_value, number_rows in searches:
+                new, time_new = timed(cr.searcher, filename, search_value, False, number_rows)
+                old, time_old = timed(searcher_bytewise, filename, search_value, reference_limit, number_rows)
+                if old is None and time_old > reference_limit:
+                    old_str = '>' + str(reference_limit)
+                    speedup = '>' + str(round(reference_limit / time_new)) + 'x'
+                else:
+                    if old != new:
+                        print("  WARNING: different results for '" + search_value + "':", old, new)
+                    old_str = "{:.4f}".format(time_old)
+                    speedup = str(round(time_old / time_new)) + 'x'
+                print("  {:>6}MB  {:<28}  {:>12}  {:>12.4f}  {:>8}".format(size, search_value, old_str, time_new, speedup))
+        finally:
+            os.remove(filename)
+    print("")
+
+
+# Best time of several repetitions of a function call, for the faster benchmarks
+def best_time(function, *args):
+    times = []
+    for i in range(repetitions):
+        result, elapsed = timed(function, *args)
+        times.append(elapsed)
+    return result, min(times)
+
+
+# Compare the buffered reading of searcher_multi() with mmap_mode, and report the file size from which mmap is faster
+def bench_mmap(sizes=mmap_sizes):
+    print("")
+    print("  Benchmarking 'searcher_multi' with buffered reading against mmap_mode")
+    print("")
+    print("  {:>10}  {:<12}  {:>12}  {:>12}  {:>8}".format('size', 'search', 'buffered [s]', 'mmap [s]', 'speedup'))
+    searches = {
+        # Lines of the final results, found in the last iteration
+        'final': {'Total energy corrected for finite basis set =': 0, 'Current cell volume =': 0, 'density =': 1, 'a =': 0, 'b =': 0, 'c =': 0},
+        # The lines read by cr_castep. The space group is only written at the top of the file, so the whole file is read
+        'castep': {'Total energy corrected for finite basis set =': 0, 'Space group of crystal =': 0, 'Current cell volume =': 0, 'density =': 1, 'a =': 0, 'b =': 0, 'c =': 0},
+    }
+    # Sizes where mmap was faster, for each search
+    faster = {search: [] for search in searches}
+    for size in sizes:
+        filename = os.path.join(bench_directory, 'cr_benchmark_' + str(size) + 'MB.castep')
+        synthetic_castep(filename, int(size * 1024 * 1024))
+        try:
+            for search, search_values in searches.items():
+                buffered, time_buffered = best_time(cr.searcher_multi, filename, search_values, False, False)
+                mapped, time_mapped = best_time(cr.searcher_multi, filename, search_values, False, True)
+                if buffered != mapped:
+                    print("  WARNING: different results for '" + search + "':", buffered, mapped)
+                faster[search].append(time_mapped < time_buffered)
+                print("  {:>8}MB  {:<12}  {:>12.6f}  {:>12.6f}  {:>7.1f}x".format(size, search, time_buffered, time_mapped, time_buffered / time_mapped))
+        finally:
+            os.remove(filename)
+    print("")
+    for search in searches:
+        # Smallest size from which mmap is always faster
+        crossover = None
+        for size, is_faster in reversed(list(zip(sizes, faster[search]))):
+            if not is_faster:
+                break
+            crossover = size
+        if crossover is None:
+            print("  " + search + ": mmap was not faster for the biggest file")
+        else:
+            print("  " + search + ": mmap is faster for files of " + str(crossover) + " MB or more")
+    print("")
+
+
+# Write a synthetic '.phonon' file with a given number of modes, for two q-points
+def synthetic_phonon(filename, modes):
+    with open(filename, 'w') as f:
+        f.write(" BEGIN header\n Number of ions         " + str(modes // 3) + "\n Number of branches   " + str(modes) + "\n END header\n")
+        for q in range(1, 3):
+            f.write("     q-pt=    " + str(q) + "   0.000000  0.000000  " + "{:.6f}".format(0.1 * (q - 1)) + "      1.0000000000\n")
+            for k in range(1, modes + 1):
+                f.write("   " + str(k).rjust(5) + "  " + "{:14.6f}".format(k * 3.141592 - 0.01) + "  " + "{:14.7f}".format(k * 0.0012345) + "\n")
+
+
+# Old way of reading the values of the phonon block, calling extract_column() for every line. Kept as a reference to compare with
+def phonon_columns(phonon_str, threshold, data_lines_phonon):
+    E_1 = cr.extract_column(phonon_str[1], 1)
+    E_2 = cr.extract_column(phonon_str[2], 1)
+    E_3 = cr.extract_column(phonon_str[3], 1)
+    E_73 = cr.extract_column(phonon_str[73], 1)
+    E_76 = cr.extract_column(phonon_str[76], 1)
+    question = 'YES' if (abs(E_1) > threshold) or (abs(E_2) > threshold) or (abs(E_3) > threshold) else 'no'
+    ZEGP = 0
+    for k in range(4, data_lines_phonon + 1):
+        ZEGP += cr.extract_column(phonon_str[k], 1)
+    return [E_1, E_2, E_3, question, E_73, E_76, ZEGP / 2]
+
+
+# Same values, converting the whole block to an array at once as in cr_phonon
+def phonon_block(phonon_str, threshold, data_lines_phonon):
+    frequencies = phonon.read_block(phonon_str[1:data_lines_phonon + 1])[:, 1]
+    E_1, E_2, E_3 = frequencies[0:3].tolist()
+    np = cr.numpy()
+    question = 'YES' if np.any(np.abs(frequencies[0:3]) > threshold) else 'no'
+    return [E_1, E_2, E_3, question, float(frequencies[72]), float(frequencies[75]), float(frequencies[3:].sum()) / 2]
+
+
+# Compare the per-line extract_column() parsing of the phonon block with the vectorized one, and the time to read the full spectrum of the file
+def bench_phonon(modes=phonon_modes):
+    print("")
+    print("  Benchmarking the parsing of the phonon blocks, per line against vectorized")
+    print("")
+    print("  {:>8}  {:>14}  {:>14}  {:>8}  {:>16}".format('modes', 'per line [s]', 'vectorized [s]', 'speedup', 'full spectrum [s]'))
+    for number in modes:
+        filename = os.path.join(bench_directory, 'cr_benchmark_' + str(number) + '.phonon')
+        synthetic_phonon(filename, number)
+        try:
+            phonon_str = cr.searcher(filename, 'q-pt=', False, number)
+            old, time_old = best_time(phonon_columns, phonon_str, phonon.threshold, number)
+            new, time_new = best_time(phonon_block, phonon_str, phonon.threshold, number)
+            if old[:-1] != new[:-1] or abs(old[-1] - new[-1]) > 1e-9 * abs(old[-1]):
+                print("  WARNING: different results:", old, new)
+            spectrum, time_spectrum = best_time(phonon.read_spectrum, filename)
+            print("  {:>8}  {:>14.6f}  {:>14.6f}  {:>7.1f}x  {:>16.6f}".format(number, time_old, time_new, time_old / time_new, time_spectrum))
+        finally:
+            os.remove(filename)
+    print("")
+
+
+# Old extract_float(), compiling the pattern on every call. Kept as a reference to compare with
+def extract_float_compile(string, name):
+    if string == None:
+        return None
+    pattern = re.compile(name + r'\s*=?\s*(-?\d+(?:\.\d+)?(?:[eE][+\-]?\d+)?)')
+    match = pattern.search(string)
+    if match:
+        return float(match.group(1))
+    else:
+        return None
+
+
+# Values of several variables of a string with a single pattern containing all the names. Kept as a reference to compare with extract_floats()
+def extract_floats_combined(string, names):
+    pattern = re.compile('(?=' + '|'.join('(' + name + r')\s*=?\s*(-?\d+(?:\.\d+)?(?:[eE][+\-]?\d+)?)' for name in names) + ')')
+    values = [None] * len(names)
+    for match in pattern.finditer(string):
+        i = (match.lastindex - 1) // 2
+        if values[i] is None:
+            values[i] = float(match.group(match.lastindex))
+    return values
+
+
+# Time per value of the extract functions: compiling the pattern on every call against the cached patterns, with and without emptying the internal cache of the re module between files, as other code may do, and one call per line with extract_floats()
+def bench_extract(calls=extract_calls):
+    if isinstance(calls, list):
+        calls = calls[0]
+    lines = [
+        ("                    a =      4.807521          alpha =   90.000000", ['a', 'alpha']),
+        ("                    b =      4.807521          beta  =   90.000000", ['b', 'beta']),
+        ("                    c =      5.807521          gamma =  120.000000", ['c', 'gamma']),
+        ("                       Current cell volume =           106.744432       A**3", ['Current cell volume']),
+        (" Total energy corrected for finite basis set =  -1234.567890123     eV", ['Total energy corrected for finite basis set']),
+        ("                                   density =             2.331418   AMU/A**3", ['density']),
+    ]
+    values = sum(len(names) for line, names in lines)
+    files = calls // values
+
+    def per_value(function, purge=False):
+        for i in range(files):
+            if purge:
+                re.purge()
+            for line, names in lines:
+                for name in names:
+                    function(line, name)
+
+    def per_line(function):
+        for i in range(files):
+            for line, names in lines:
+                function(line, names)
+
+    results = [
+        ('extract_float(), compiling every call', best_time(per_value, extract_float_compile)[1]),
+        ('extract_float(), cached patterns', best_time(per_value, cr.extract_float)[1]),
+        ('re cache emptied, compiling every call', best_time(per_value, extract_float_compile, True)[1]),
+        ('re cache emptied, cached patterns', best_time(per_value, cr.extract_float, True)[1]),
+        ('extract_floats(), per line', best_time(per_line, cr.extract_floats)[1]),
+        ('single pattern with all the names, per line', best_time(per_line, extract_floats_combined)[1]),
+    ]
+    print("")
+    print("  Benchmarking the extract functions, " + str(files * values) + " values")
+    print("")
+    print("  {:<46}  {:>14}".format('', 'per value [us]'))
+    for name, elapsed in results:
+        print("  {:<46}  {:>14.3f}".format(name, elapsed * 1e6 / (files * values)))
+    print("")
+
+
+# Stand-in filesystem, waiting 'latency' seconds on each stat and open, as on a network filesystem
+class SlowFileSystem(cr.FileSystem):
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def open(self, filename):
+        time.sleep(self.latency)
+        return super().open(filename)
+
+    def stat(self, filename):
+        time.sleep(self.latency)
+        return super().stat(filename)
+
+
+# Read a tree of castep files through a stand-in filesystem with some latency, without prefetching and with several numbers of prefetch threads
+def bench_prefetch(latencies=prefetch_latencies):
+    path = tempfile.mkdtemp(prefix='cr_benchmark_', dir=bench_directory)
+    directories = ['struct-' + str(i).zfill(6) for i in range(prefetch_folders)]
+    for directory in directories:
+        os.mkdir(os.path.join(path, directory))
+        synthetic_castep(os.path.join(path, directory, 'cc-2.castep'), prefetch_file_size)
+    reader = functools.partial(castep.read_directory, path=path, data_castep='cc-2.castep')
+    print("")
+    print("  Benchmarking the prefetch of " + str(prefetch_folders) + " castep files, with a stand-in filesystem")
+    print("")
+    print("  {:>12}  {:>8}  {:>10}  {:>8}".format('latency [s]', 'prefetch', 'time [s]', 'speedup'))
+    try:
+        for latency in latencies:
+            cr.filesystem = SlowFileSystem(latency)
+            reference = None
+            for depth in prefetch_depths:
+                rows, elapsed = timed(lambda: list(cr.read_directories(reader, directories, path, 'cc-2.castep', prefetch=depth)))
+                if reference is None:
+                    reference, time_reference = rows, elapsed
+                elif rows != reference:
+                    print("  WARNING: different results with prefetch =", depth)
+                print("  {:>12}  {:>8}  {:>10.3f}  {:>7.1f}x".format(latency, depth, elapsed, time_reference / elapsed))
+    finally:
+        cr.filesystem = cr.FileSystem()
+        for directory in directories:
+            os.remove(os.path.join(path, directory, 'cc-2.castep'))
+            os.rmdir(os.path.join(path, directory))
+        os.rmdir(path)
+    print("")
+
+
+# Old search of the lines of a file, decoding every line read to a string before comparing it. Kept as a reference to compare with search_file(), which compares the lines as bytes
+def search_file_text(filename, search_values, time_limit=False):
+    results = dict.fromkeys(search_values)
+    pending = dict(search_values)
+    following = collections.deque(maxlen=max(search_values.values(), default=0))
+    time_start = time.time()
+    for line in cr.reverse_lines(filename):
+        if time_limit and time.time() - time_start > time_limit:
+            break
+        line = line.strip()
+        if line.startswith(tuple(pending)):
+            for search_value, number_rows in list(pending.items()):
+                if not line.startswith(search_value):
+                    continue
+                if number_rows == 0:
+                    results[search_value] = line
+                else:
+                    results[search_value] = [line] + [next_line for next_line in list(following)[:number_rows] if next_line]
+                del pending[search_value]
+            if not pending:
+                break
+        following.appendleft(line)
+    return results
+
+
+# Compare the search of the lines as bytes with the old search decoding every line, on pure-ASCII castep files, for the final results and for a full scan
+def bench_bytes(sizes=bytes_sizes):
+    print("")
+    print("  Benchmarking the search of the lines as bytes against decoding every line")
+    print("")
+    print("  {:>8}  {:<12}  {:>10}  {:>10}  {:>8}  {:>8}".format('size', 'search', 'text [s]', 'bytes [s]', 'speedup', 'MB/s'))
+    searches = {
+        'final': {'Total energy corrected for finite basis set =': 0, 'Current cell volume =': 0, 'density =': 1, 'a =': 0, 'b =': 0, 'c =': 0},
+        'castep': {'Total energy corrected for finite basis set =': 0, 'Space group of crystal =': 0, 'Current cell volume =': 0, 'density =': 1, 'a =': 0, 'b =': 0, 'c =': 0},
+    }
+    for size in sizes:
+        filename = os.path.join(bench_directory, 'cr_benchmark_' + str(size) + 'MB.castep')
+        synthetic_castep(filename, int(size * 1024 * 1024))
+        try:
+            for search, search_values in searches.items():
+                text, time_text = best_time(search_file_text, filename, search_values)
+                found, time_bytes = best_time(cr.search_file, filename, search_values)
+                if text != found:
+                    print("  WARNING: different results for '" + search + "':", text, found)
+                megabytes = size if search == 'castep' else 0
+                print("  {:>6}MB  {:<12}  {:>10.5f}  {:>10.5f}  {:>7.1f}x  {:>8}".format(size, search, time_text, time_bytes, time_text / time_bytes, "{:.0f}".format(megabytes / time_bytes) if megabytes else '-'))
+        finally:
+            os.remove(filename)
+    print("")
+
+
+# Import times reported by 'python -X importtime' when importing a module in a fresh interpreter, as a dict of {module: (self_us, cumulative_us)}
+def import_times(module):
+    import subprocess
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if process.returncode != 0:
+        raise ImportError(process.stderr.strip().splitlines()[-1])
+    times = {}
+    for line in process.stderr.splitlines():
+        match = re.match(r'import time:\s+(\d+)\s*\|\s*(\d+)\s*\|\s*(.*)', line)
+        if match:
+            times[match.group(3).strip()] = (int(match.group(1)), int(match.group(2)))
+    return times
+
+
+# Time to import each module in a fresh interpreter, with the slowest modules that it imports, to notice when a heavy dependency is imported at startup again
+def bench_startup(modules=startup_modules):
+    print("")
+    print("  Benchmarking the startup time, with 'python -X importtime'")
+    print("  Limit:", startup_limit, "ms")
+    print("")
+    for module in modules:
+        # The best of several runs, as the first one may have to compile the files
+        best = None
+        for i in range(repetitions):
+            times = import_times(module)
+            if best is None or times[module][1] < best[module][1]:
+                best = times
+        total = best[module][1] / 1000
+        print("  {:<12}  {:>8.1f} ms".format(module, total))
+        slowest = sorted(((value[1], name) for name, value in best.items() if name != module), reverse=True)[:startup_slowest]
+        for cumulative, name in slowest:
+            print("      {:<32}  {:>8.1f} ms".format(name, cumulative / 1000))
+        if total > startup_limit:
+            print("  WARNING: importing " + module + " took more than", startup_limit, "ms")
+    print("")
+
+
+# Modes of the 'suite' benchmark, with the data files that each one reads
+suite_modes = {
+    'castep': [corpus.data_castep],
+    'cif': [corpus.data_cif],
+    'phonon': [corpus.data_phonon],
+    'folder': [corpus.data_castep, corpus.data_cif, corpus.data_phonon],
+}
+
+
+# Peak resident memory of this process, in MB, or None if it can not be known in this system
+def peak_rss():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux gives it in kB, and macOS in bytes
+    return rss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+# Run the main() of a mode on the corpus in 'path', without its console output, and print the elapsed seconds and the peak memory as JSON. It is run by bench_suite() in a new process for each mode, so that the peak memory is the one of that mode
+def suite_run(mode, path):
+    import io
+    import contextlib
+    module = cr.reader_module(mode)
+    out = os.path.join(path, 'out_' + mode + '.csv')
+    out_error = os.path.join(path, 'errors_' + mode + '.txt')
+    time_start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        module.main(path, ' '.join(suite_modes[mode]), out, out_error)
+    elapsed = time.perf_counter() - time_start
+    os.remove(out)
+    if os.path.isfile(out_error):
+        os.remove(out_error)
+    print(json.dumps({'seconds': elapsed, 'rss': peak_rss()}))
+
+
+# Write a synthetic corpus with cr_corpus.py, with missing, corrupted and truncated files, and read it with each mode, reporting the files and MB read per second and the peak memory.
+# The results are added to 'suite_file', and compared with the previous run with the same number of folders
+def bench_suite(folders=suite_folders):
+    import subprocess
+    import platform
+    history = []
+    if os.path.isfile(suite_file):
+        with open(suite_file, 'r') as f:
+            history = json.load(f)
+    print("")
+    print("  Benchmarking the reading of a synthetic corpus, with each mode")
+    print("")
+    print("  {:>8}  {:<8}  {:>9}  {:>9}  {:>8}  {:>9}  {:>10}".format('folders', 'mode', 'time [s]', 'files/s', 'MB/s', 'RSS [MB]', 'previous'))
+    run = {'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'version': cr.version(), 'python': platform.python_version(), 'platform': platform.platform(),
+           'corpus': {'castep_size': corpus.castep_size, 'phonon_modes': corpus.phonon_modes, 'phonon_qpts': corpus.phonon_qpts, 'cif_atoms': corpus.cif_atoms, 'missing': corpus.missing, 'corrupted': corpus.corrupted, 'truncated': corpus.truncated, 'seed': corpus.seed},
+           'results': []}
+    for count in folders:
+        path = tempfile.mkdtemp(prefix='cr_benchmark_', dir=bench_directory)
+        try:
+            corpus.write_corpus(path, count)
+            # Number and bytes of the files read by each mode. The folder mode reads the three files of each folder, and the missing files are not read
+            counts = {}
+            sizes = {}
+            for directory in os.listdir(path):
+                for data_file in os.listdir(os.path.join(path, directory)):
+                    counts[data_file] = counts.get(data_file, 0) + 1
+                    sizes[data_file] = sizes.get(data_file, 0) + os.path.getsize(os.path.join(path, directory, data_file))
+            for mode, data_files in suite_modes.items():
+                process = subprocess.run([sys.executable, '-c', 'import cr_benchmark; cr_benchmark.suite_run(' + repr(mode) + ', ' + repr(path) + ')'], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+                if process.returncode != 0:
+                    print("  WARNING: the '" + mode + "' mode failed:", process.stderr.strip().splitlines()[-1])
+                    continue
+                measured = json.loads(process.stdout.strip().splitlines()[-1])
+                files = sum(counts.get(data_file, 0) for data_file in data_files)
+                megabytes = sum(sizes.get(data_file, 0) for data_file in data_files) / (1024 * 1024)
+                result = {'folders': count, 'mode': mode, 'seconds': measured['seconds'], 'files': files, 'files_per_second': files / measured['seconds'], 'megabytes': megabytes, 'megabytes_per_second': megabytes / measured['seconds'], 'peak_rss_megabytes': measured['rss']}
+                run['results'].append(result)
+                # Same measurement in the last run with the same corpus
+                previous = None
+                for old_run in history:
+                    if old_run.get('corpus') == run['corpus']:
+                        for old_result in old_run['results']:
+                            if old_result['folders'] == count and old_result['mode'] == mode:
+                                previous = old_result
+                rss = '-' if result['peak_rss_megabytes'] is None else "{:.1f}".format(result['peak_rss_megabytes'])
+                speedup = '-' if previous is None else "{:.2f}x".format(previous['seconds'] / result['seconds'])
+                print("  {:>8}  {:<8}  {:>9.3f}  {:>9.0f}  {:>8.1f}  {:>9}  {:>10}".format(count, mode, result['seconds'], result['files_per_second'], result['megabytes_per_second'], rss, speedup))
+        finally:
+            shutil.rmtree(path)
+    history.append(run)
+    with open(suite_file, 'w') as f:
+        json.dump(history, f, indent=1)
+    print("")
+    print("  Results added to ", suite_file)
+    print("")
+
+
+# Row of a castep job with the default fields, with different values for each row, as read from real files
+def table_row(i, random):
+    return ['struct-' + str(i).zfill(7), -1234.5 - random.random(), ['Pnma', 'P63/mmc', 'Fm-3m', 'P1'][i % 4]] + [random.random() * 10 for field in castep.default_fields[2:]]
+
+
+# Memory used by the rows of a castep job kept as a list of lists, with the header as the first row, against a cr_table.Table, and the time to add the rows to the table
+def bench_table(rows=table_rows):
+    import random
+    import tracemalloc
+    header = castep.make_header(castep.default_fields)
+    types = castep.make_types(castep.default_fields)
+    # NumPy is imported before measuring, so that its modules are not counted
+    cr.numpy()
+    print("")
+    print("  Benchmarking the memory of the rows kept as lists against a table of typed columns")
+    print("")
+    print("  {:>9}  {:>11}  {:>11}  {:>11}  {:>11}  {:>8}  {:>10}".format('rows', 'lists [MB]', 'table [MB]', 'lists B/row', 'table B/row', 'ratio', 'append [s]'))
+    for count in rows:
+        random.seed(0)
+        tracemalloc.start()
+        lists = [header] + [table_row(i, random) for i in range(count)]
+        memory_lists = tracemalloc.get_traced_memory()[0]
+        del lists
+        tracemalloc.stop()
+        random.seed(0)
+        tracemalloc.start()
+        table = cr_table.Table(header, types)
+        for i in range(count):
+            table.append(table_row(i, random))
+        table.flush()
+        memory_table = tracemalloc.get_traced_memory()[0]
+        del table
+        tracemalloc.stop()
+        # The time is measured without tracemalloc, which slows down every allocation
+        random.seed(0)
+        pending = [table_row(i, random) for i in range(count)]
+        time_start = time.perf_counter()
+        table = cr_table.Table(header, types)
+        for row in pending:
+            table.append(row)
+        table.flush()
+        time_table = time.perf_counter() - time_start
+        del table, pending
+        print("  {:>9}  {:>11.1f}  {:>11.1f}  {:>11.0f}  {:>11.0f}  {:>7.1f}x  {:>10.2f}".format(count, memory_lists / 1e6, memory_table / 1e6, memory_lists / count, memory_table / count, memory_lists / memory_table, time_table))
+    print("")
+
+
+if __name__ == '__main__':
+    benchmarks = {
+        'searcher': bench_searcher,
+        'mmap': bench_mmap,
+        'phonon': bench_phonon,
+        'extract': bench_extract,
+        'prefetch': bench_prefetch,
+        'startup': bench_startup,
+        'bytes': bench_bytes,
+        'suite': bench_suite,
+        'table': bench_table,
+    }
+    if len(sys.argv) < 2 or sys.argv[1] not in benchmarks:
+        print("  Usage: python cr_benchmark.py [" + "|".join(benchmarks) + "] [arguments]")
+        exit()
+    if sys.argv[1] == 'startup':
+        arguments = sys.argv[2:]
+    else:
+        arguments = [float(x) if '.' in x else int(x) for x in sys.argv[2:]]
+    if arguments:
+        benchmarks[sys.argv[1]](arguments)
+    else:
+        benchmarks[sys.argv[1]]()
@@ -0,0 +1,112 @@
+"""
+CrystalReader Cache. Keep the values extracted from each file, to avoid reading it again if it did not change.
+Copyright (C) 2023  Pablo Gila-Herranz
+If you find this code useful, a citation would be awesome :D
+Pablo Gila-Herranz, “CrystalReader”, 2023. https://github.com/pablogila/CrystalReader
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import os
+import sys
+import json
+import time
+
+
+##################################################################
+#                PARAMETERS THAT YOU MAY MODIFY
+##################################################################
+# Default name of the cache file, used with 'cache=yes' in the batch job file
+default_cache = 'CrystalReader_cache.sqlite'
+# Maximum number of files kept in the cache. When there are more, the least recently used ones are removed
+max_entries = 500000
+##################################################################
+# Usage, from the command line, to empty the cache:
+# python cr_cache.py clear [cache_file]
+
+
+# Cache of the rows extracted from each file, stored in a SQLite database.
+# An entry is only used if the path, the size and the modification time of the file, as well as the requested fields, are the same as when it was stored
+class Cache:
+
+    def __init__(self, filename=default_cache):
+        self.filename = filename
+        self.hits = 0
+        self.misses = 0
+        # sqlite3 is only imported when the cache is used
+        import sqlite3
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS entries (path TEXT, fields TEXT, size INTEGER, mtime INTEGER, result TEXT, last_used REAL, PRIMARY KEY (path, fields))")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+
+    # Return the stored (row, errors) of a file, or None if the file is not in the cache or it changed since then
+    def get(self, path, stat, fields):
+        entry = self.connection.execute("SELECT result FROM entries WHERE path = ? AND fields = ? AND size = ? AND mtime = ?", (path, fields, stat[0], stat[1])).fetchone()
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.connection.execute("UPDATE entries SET last_used = ? WHERE path = ? AND fields = ?", (time.time(), path, fields))
+        row, errors = json.loads(entry[0])
+        return row, errors
+
+    # Store the (row, errors) result of a file
+    def put(self, path, stat, fields, result):
+        self.connection.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)", (path, fields, stat[0], stat[1], json.dumps(result), time.time()))
+
+    # Remove the entries of the files whose path starts with 'prefix', or all of them by default
+    def invalidate(self, prefix=''):
+        self.connection.execute("DELETE FROM entries WHERE substr(path, 1, ?) = ?", (len(prefix), prefix))
+        self.connection.commit()
+
+    # Remove the least recently used entries, keeping only 'limit' entries, which is 'max_entries' by default
+    def evict(self, limit=None):
+        if limit is None:
+            limit = max_entries
+        count = self.connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        if count > limit:
+            self.connection.execute("DELETE FROM entries WHERE rowid IN (SELECT rowid FROM entries ORDER BY last_used ASC LIMIT ?)", (count - limit,))
+
+    # Save the changes and close the database, after removing the entries above the size limit
+    def close(self):
+        self.evict()
+        self.connection.commit()
+        self.connection.close()
+
+
+# Size and modification time of a file, which identify its version in the cache, or None if the file does not exist
+def file_stat(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+# Remove all the entries of a cache file
+def clear(filename=default_cache):
+    if os.path.isfile(filename):
+        cache = Cache(filename)
+        cache.invalidate()
+        cache.connection.execute("VACUUM")
+        cache.close()
+    print("  Cache cleared:", filename)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 2 and sys.argv[1] == 'clear':
+        clear(*sys.argv[2:3])
+    else:
+        print("  Usage: python cr_cache.py clear [cache_file]")
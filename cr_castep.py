@@ -21,26 +21,34 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import os
 import time
+import functools
+import collections
+import array
 import cr_common as cr
-import pandas as pd
+import cr_table
 
 
 ##################################################################
 #                PARAMETERS THAT YOU MAY MODIFY
 ##################################################################
-# !!! IF YOU CHANGE THE HEADER, make sure to change the columns in the 'row = [...]' line, as well to comment the unnecesary 'searcher' and 'extract' lines. Full header is shown in the next comment for further reference:
-# header = ['filename', 'enthalpy [eV]', 'enthalpy [kJ/mol]', 'total energy corrected [eV]', 'space group', 'a', 'b', 'c', 'alpha', 'beta', 'gamma', 'cell volume [A^3]', 'density [amu/A^3]', 'density [g/cm^3]']
-header = ['filename', 'total energy corrected [eV]', 'space group', 'a', 'b', 'c', 'alpha', 'beta', 'gamma', 'cell volume [A^3]', 'density [amu/A^3]', 'density [g/cm^3]']
+# Fields to extract, in the order of the columns of the output, after the 'filename'. The files are only searched for the lines needed by these fields.
+# All the available fields are listed in 'castep_fields', below. They can also be chosen for each job, with 'fields=energy space_group a b c' in the batch job file
+default_fields = ['energy', 'space_group', 'a', 'b', 'c', 'alpha', 'beta', 'gamma', 'volume', 'density', 'density_g']
 # Run the main script for *.castep files at execution. Set to False to import the functions as a module.
 run_at_import = False
 # Rename the file_name in the xxx-xxx-xxx-xxx format, set to False to keep the original name
 rename_files = False
-# Seconds for a loop to be considered as an error (a.k.a. seconds for me to cry). Remove this threshold by setting 'cry = False'
-cry = 10
+# Bytes searched first from the end of the files, where the final results are. While some values are missing, the search goes on backwards in blocks 'tail_step' times bigger each time
+tail_window = 1048576
+tail_step = 4
+# Maximum bytes searched from the end of each file, instead of a time limit, so that the time to read a file does not depend on the load of the machine. Values before it are reported as missing. Set to None to search the whole file
+tail_cap = 268435456
+# Seconds to give up on a file, besides the 'tail_cap', shared by all the searches of the file. Set to False for no time limit
+cry = False
 # Omit, or not, all values from corrupted files
 safemode = False
-# Main program for reading castep files. Change the default arguments to run the script from the command line
-def main(data_directory='data', data_castep='cc-2.castep', out='out_castep.csv', out_error='errors_castep.txt'):
+# Main program for reading castep files. Change the default arguments to run the script from the command line. With 'table=True', the rows are also kept in memory as a cr_table.Table, which is returned. A 'budget' of seconds can be given for the whole job, as in cr.main_setup()
+def main(data_directory='data', data_castep='cc-2.castep', out='out_castep.csv', out_error='errors_castep.txt', workers=1, mmap_mode=False, cache=False, cache_clear=False, incremental=False, flush_interval=100, prefetch=0, index=False, stats=False, fields=None, trajectory=False, table=False, budget=False):
 ##################################################################
 
     print("")
@@ -55,121 +63,280 @@ def main(data_directory='data', data_castep='cc-2.castep', out='out_castep.csv',
     print("  data files:          ", data_castep)
     print("  output file:         ", out)
     print("  error log:           ", out_error)
+    print("  tail window:         ", tail_window, "bytes, up to", tail_cap)
     print("  abortion time:       ", cry)
+    print("  budget:              ", budget)
     print("  safemode:            ", safemode)
+    print("  workers:             ", workers)
+    print("  mmap mode:           ", mmap_mode)
+    print("  cache:               ", cache)
+    print("  incremental:         ", incremental)
+    print("  flush interval:      ", flush_interval)
+    print("  prefetch:            ", prefetch)
+    print("  index:               ", index)
+    print("  stats:               ", stats)
+    print("  trajectory:          ", trajectory)
     print("")
 
-    # Set some values to avoid stupid errors if we comment some lines:
-    enthalpy = None
-    space_group_str = None
+    if fields is None:
+        fields = default_fields
+    unknown = [field for field in fields if field not in castep_fields]
+    if unknown:
+        error_unknown_fields(unknown)
+        return
+    header = make_header(fields)
 
-    # Get the absolute path to the directory containing the Python script
-    dir_path = os.path.dirname(os.path.realpath(__file__))
-    # Specify the path to the directory containing the folders with the .castep files, relative to the script's directory
-    path = os.path.join(dir_path, data_directory)
-    # Get the names of all the directories in the given path, and store them in a list
-    directories = [d for d in os.listdir(path) if os.path.isdir(os.path.join(path, d))]
+    # Folders with the data files, the stats of the run and the deadline of the budget of the whole job
+    path, directories, data_castep, run_stats, job_deadline = cr.main_setup(data_directory, data_castep, out, index, stats, budget)
+
+    # Start a timer, for the final message
+    time_start = time.time()
+
+    # Read the file in each folder of the /data path. The row of each folder is extracted by read_directory()
+    reader = functools.partial(read_directory, path=path, data_castep=data_castep, window=cr.Window(tail_window, tail_step, tail_cap), safemode=safemode, rename_files=rename_files, mmap_mode=mmap_mode, fields=fields, cry=cry, budget=job_deadline)
+    # The results of previous runs are only reused if they were extracted with the same header and settings
+    settings = str([cr.version(), header, safemode, rename_files, tail_cap])
+    rows = cr_table.Table(header, make_types(fields)) if table else None
+    messages = cr.main_loop(reader, directories, path, data_castep, header, out, out_error, settings, workers, cache, cache_clear, incremental, flush_interval, prefetch, run_stats, rows)
+
+    # Final message   
+    time_elapsed = round(time.time() - time_start, 1)
+    print("")
+    print("  Finished reading ", data_directory + "/.../" + data_castep, " files in " + str(time_elapsed) + " seconds")
+    print("  Data extracted and saved to ", out)
+    for message in messages:
+        print("  " + message)
+    print("")
+
+    # Save the values of every LBFGS iteration, if requested
+    if trajectory:
+        if trajectory is True:
+            trajectory = os.path.splitext(out)[0] + '_trajectory.npz'
+        save_trajectories(directories, path, data_castep, trajectory, workers)
+    return rows
+
+
+# Read the .castep file of a single directory, returning the row of values and a list with the errors found.
+# It is called by main() for every directory, maybe from another process, so the parameters are passed as arguments
+def read_directory(directory, path, data_castep, window=cr.Window(tail_window, tail_step, tail_cap), safemode=safemode, rename_files=rename_files, mmap_mode=False, fields=default_fields, cry=cry, budget=None):
+
+    # Define the path to the .castep file
+    file_castep = os.path.join(path, directory, data_castep)
+
+    # Rename, or not, the file_name in the xxx-xxx-xxx-xxx format
+    if rename_files == True:
+        file_name = cr.naming(directory)
+    else:
+        file_name = directory
+
+    # Check if the file exists
+    if not cr.file_exists(file_castep):
+        error = [file_name, 'missing file']
+        return None, [error]
+
+    return read_file(file_castep, file_name, window, safemode, mmap_mode, fields, cry, budget)
+
+
+# Read a .castep file, given by its name or as a binary file object, returning the row of values, starting with the 'file_name', and a list with the errors found.
+# The file gets 'cry' seconds, or less if the 'budget' of the job, given as a Deadline, ends before
+def read_file(file_castep, file_name, window=cr.Window(tail_window, tail_step, tail_cap), safemode=safemode, mmap_mode=False, fields=default_fields, cry=cry, budget=None):
 
-    # Empty arrays to store the data
     errors = []
-    rows = []
-    rows.append(header)
+    deadline = cr.Deadline(cry, budget)
 
-    # Start a timer and counter, for the progress bar and warning messages
-    time_start = time.time()
-    bar = time_start
-    loop = 0
+    # Read the file looking only for the lines of the requested fields, all of them in a single pass, and extract their values
+    row = [file_name] + cr.read_fields(file_castep, castep_fields, fields, deadline, mmap_mode, window)
 
-    # Loop through all the folders in the /data path
-    for directory in directories:
+    # Report how far the search got if the time was over
+    if deadline.expired:
+        errors.append([file_name, ' ' + deadline.report()])
 
-        # Progress bar, just for fun
-        loop += 1
-        cr.progressbar(loop, len(directories), bar)
-        
-        # Define the path to the .castep file
-        file_castep = os.path.join(path, directory, data_castep)
-
-        # Check if the file exists
-        if not os.path.isfile(file_castep):
-            error = [file_name, 'missing file']
+    # ERRORS: Check if any of the values are missing
+    error = [file_name, ' missing value/s', ' safemode = ' + str(safemode)]
+    for i, var in enumerate(row):
+        if var is None:
             errors.append(error)
+            if safemode == True:
+                row = [file_name]
+            break
+
+    return row, errors
+
+
+# A value that can be read from the files: the 'name' and 'units' of its column, the beginning of the line to 'search', the number of 'rows' to read after that line, and a function to 'extract' the value from the line(s) found, which gets None if the line was not found
+Field = collections.namedtuple('Field', ['name', 'units', 'search', 'rows', 'extract'])
+
+
+# Title of the column of a field, with the units between brackets
+def field_title(field):
+    if field.units:
+        return field.name + ' [' + field.units + ']'
+    return field.name
+
+
+# Header of the output for a list of fields: the filename, followed by the title of each field
+def make_header(fields):
+    return ['filename'] + [field_title(castep_fields[field]) for field in fields]
+
+
+# Type of each column of the header, for the tables of cr_table.py. All the fields are floats but the space group
+def make_types(fields):
+    return ['text'] + ['category' if field in category_fields else 'float' for field in fields]
+
+
+# Multiply a value by a conversion factor, if the value was found
+def convert(value, factor):
+    if value is None:
+        return None
+    return value * factor
+
+
+# Value of the line after the 'density =' line, with the density in g/cm^3
+def extract_density_g(lines):
+    if lines is None or len(lines) < 2:
+        return None
+    return cr.extract_float(lines[1], '')
+
+
+# Space group, with the commas replaced to avoid little stupid errors in the CSV
+def extract_space_group(line):
+    if line is None:
+        return None
+    return cr.extract_str(line.replace(',', '.'), 'Space group of crystal')
+
+
+##################################################################
+#           FIELDS THAT CAN BE READ FROM THE CASTEP FILES
+##################################################################
+# To read a new value, add a new Field here. Fields with the same 'search' line must have the same number of 'rows'
+castep_fields = {
+    'enthalpy': Field('enthalpy', 'eV', 'LBFGS: Final Enthalpy     =', 0, lambda line: cr.extract_float(line, 'LBFGS: Final Enthalpy')),
+    'enthalpy_kjmol': Field('enthalpy', 'kJ/mol', 'LBFGS: Final Enthalpy     =', 0, lambda line: convert(cr.extract_float(line, 'LBFGS: Final Enthalpy'), cr.ev_kjmol())),
+    'energy': Field('total energy corrected', 'eV', 'Total energy corrected for finite basis set =', 0, lambda line: cr.extract_float(line, 'Total energy corrected for finite basis set')),
+    'space_group': Field('space group', '', 'Space group of crystal =', 0, extract_space_group),
+    'a': Field('a', '', 'a =', 0, lambda line: cr.extract_float(line, 'a')),
+    'b': Field('b', '', 'b =', 0, lambda line: cr.extract_float(line, 'b')),
+    'c': Field('c', '', 'c =', 0, lambda line: cr.extract_float(line, 'c')),
+    'alpha': Field('alpha', '', 'a =', 0, lambda line: cr.extract_float(line, 'alpha')),
+    'beta': Field('beta', '', 'b =', 0, lambda line: cr.extract_float(line, 'beta')),
+    'gamma': Field('gamma', '', 'c =', 0, lambda line: cr.extract_float(line, 'gamma')),
+    'volume': Field('cell volume', 'A^3', 'Current cell volume =', 0, lambda line: cr.extract_float(line, 'Current cell volume')),
+    'density': Field('density', 'amu/A^3', 'density =', 1, lambda lines: cr.extract_float(lines and lines[0], 'density')),
+    'density_g': Field('density', 'g/cm^3', 'density =', 1, extract_density_g),
+}
+##################################################################
+
+
+# Fields with a few different values, kept as categories by cr_table.py
+category_fields = ['space_group']
+
+
+# Values saved for each LBFGS iteration by trajectory(), besides the 'iteration' and the 'enthalpy' of the iteration, as in 'castep_fields'
+trajectory_fields = ['energy', 'a', 'b', 'c', 'alpha', 'beta', 'gamma', 'volume', 'density']
+
+
+# Read a .castep file forwards, in a single pass, yielding a dict for each LBFGS iteration, with the 'iteration' number, the 'enthalpy' and the last values of the 'trajectory_fields' found before the end of the iteration.
+# Only the current values are kept, so the memory used does not depend on the size of the file. The 'iteration' is None if the line of the end of the iteration is cut, as in truncated runs
+def trajectory(filename):
+    searches = {}
+    for field in trajectory_fields:
+        searches.setdefault(castep_fields[field].search, []).append(field)
+    finished = 'LBFGS: finished iteration'
+    prefixes = tuple(searches) + (finished,)
+    values = dict.fromkeys(trajectory_fields)
+    with open(filename, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line.startswith(prefixes):
+                continue
+            if line.startswith(finished):
+                iteration = cr.extract_float(line, finished)
+                record = {'iteration': None if iteration is None else int(iteration), 'enthalpy': cr.extract_float(line, 'enthalpy')}
+                record.update(values)
+                yield record
+                continue
+            for search, fields in searches.items():
+                if line.startswith(search):
+                    for field in fields:
+                        # Fields reading several rows get a list of lines, but only the first one is needed here
+                        values[field] = castep_fields[field].extract([line] if castep_fields[field].rows else line)
+
+
+# Read the trajectory of the .castep file of a single directory. Returns the file name, a dict with an array of floats for each column ('iteration', 'enthalpy' and 'trajectory_fields'), and a list with the errors found.
+# The iterations without a number, whose line was cut, are skipped and reported as errors
+def read_directory_trajectory(directory, path, data_castep, rename_files=rename_files):
+    file_castep = os.path.join(path, directory, data_castep)
+    if rename_files == True:
+        file_name = cr.naming(directory)
+    else:
+        file_name = directory
+    columns = {column: array.array('d') for column in ['iteration', 'enthalpy'] + trajectory_fields}
+    if not os.path.isfile(file_castep):
+        return file_name, columns, [[file_name, 'missing file']]
+    errors = []
+    for record in trajectory(file_castep):
+        if record['iteration'] is None:
+            errors.append([file_name, ' malformed LBFGS iteration', ' after iteration ' + (str(int(columns['iteration'][-1])) if columns['iteration'] else 'none')])
             continue
+        for column, values in columns.items():
+            values.append(float('nan') if record[column] is None else record[column])
+    if len(columns['iteration']) == 0:
+        errors.append([file_name, ' no LBFGS iterations'])
+    return file_name, columns, errors
 
-        # Rename, or not, the file_name in the xxx-xxx-xxx-xxx format
-        if rename_files == True:
-            file_name = cr.naming(directory)
-        else:
-            file_name = directory
-
-        # Read the file and look for the desired lines
-        #enthalpy_str = cr.searcher(file_castep, 'LBFGS: Final Enthalpy     =', cry)
-        energy_str = cr.searcher(file_castep, 'Total energy corrected for finite basis set =', cry)
-        space_group_str = cr.searcher(file_castep, 'Space group of crystal =', cry)
-        volume_str = cr.searcher(file_castep, 'Current cell volume =', cry)
-        density_str = cr.searcher(file_castep, 'density =', cry, 1)
-        a_str = cr.searcher(file_castep, 'a =', cry)
-        b_str = cr.searcher(file_castep, 'b =', cry)
-        c_str = cr.searcher(file_castep, 'c =', cry)
-
-        # Avoid little stupid errors
-        if space_group_str != None:
-            space_group_str = space_group_str.replace(',','.')
-
-        # Extract the values from the strings
-        #enthalpy = cr.extract_float(enthalpy_str, 'LBFGS: Final Enthalpy')
-        energy = cr.extract_float(energy_str, 'Total energy corrected for finite basis set')
-        space_group = cr.extract_str(space_group_str, 'Space group of crystal')
-        volume = cr.extract_float(volume_str, 'Current cell volume')
-        density = cr.extract_float(density_str[0], 'density')
-        density_g = cr.extract_float(density_str[1], '')
-        a = cr.extract_float(a_str, 'a')
-        b = cr.extract_float(b_str, 'b')
-        c = cr.extract_float(c_str, 'c')
-        alpha = cr.extract_float(a_str, 'alpha')
-        beta = cr.extract_float(b_str, 'beta')
-        gamma = cr.extract_float(c_str, 'gamma')
-
-        # Convert enthalpy from eV to kJ/mol
-        if enthalpy != None:
-            enthalpy_ev = enthalpy * cr.ev_kjmol()
-        else:
-            enthalpy_ev = None
-
-        ##################################################################
-        #       IF YOU MODIFIED THE HEADER, MODIFY THE COLUMNS TOO
-        ##################################################################
-        # Values to save. Full row in the following comment for further reference:
-        # row = [file_name, enthalpy, enthalpy_ev, energy, space_group, a, b, c, alpha, beta, gamma, volume, density, density_g]
-        row = [file_name, energy, space_group, a, b, c, alpha, beta, gamma, volume, density, density_g]
-        ##################################################################
-
-        # ERRORS: Check if any of the values are missing
-        error = [file_name, ' missing value/s', ' safemode = ' + str(safemode)]
-        for i, var in enumerate(row):
-            if var is None:
-                errors.append(error)
-                bar = True
-                if safemode == True:
-                    row = [file_name]
-                break
-
-        rows.append(row)
 
+# Save the trajectories of all the directories to a compressed NumPy .npz file, as a table with a row for each LBFGS iteration, and the arrays:
+# 'filename' (structures), 'structure' (rows, index of the filename of each row), 'iteration' (rows), and a column of floats for the 'enthalpy' and each of the 'trajectory_fields', with NaN for the missing values.
+# The columns are kept as compact arrays of floats until they are saved. Load it back with load_trajectories()
+def save_trajectories(directories, path, data_castep, out_trajectory, workers=1):
+    np = cr.numpy()
+    if np is None:
+        print("  ------------------------------------------------------------")
+        print("  ERROR:  Could not import the numpy module, needed to save")
+        print("  the trajectories. Perform 'pip install --user numpy'")
+        print("  ------------------------------------------------------------")
+        print("")
+        return
+    print("  Reading the trajectories...")
+    time_start = time.time()
+    names = []
+    structure = array.array('l')
+    table = {column: array.array('d') for column in ['iteration', 'enthalpy'] + trajectory_fields}
+    errors = []
+    loop = 0
+    reader = functools.partial(read_directory_trajectory, path=path, data_castep=data_castep, rename_files=rename_files)
+    for file_name, columns, file_errors in cr.pool_map(reader, directories, workers):
+        errors.extend(file_errors)
+        if len(columns['iteration']) > 0:
+            structure.extend([len(names)] * len(columns['iteration']))
+            names.append(file_name)
+            for column, values in columns.items():
+                table[column].extend(values)
+        loop += 1
+        cr.progressbar(loop, len(directories), time_start if not errors else True)
+    print("")
+    arrays = {column: np.frombuffer(values, dtype=float) for column, values in table.items()}
+    arrays['iteration'] = arrays['iteration'].astype(int)
+    np.savez_compressed(out_trajectory, filename=np.array(names, dtype=str), structure=np.frombuffer(structure, dtype=structure.typecode), **arrays)
+    cr.errorlog(os.path.splitext(out_trajectory)[0] + '_errors.txt', errors)
+    print("  Trajectories of", len(names), "structures,", len(structure), "iterations, saved to ", out_trajectory, "in", round(time.time() - time_start, 1), "s")
     print("")
 
-    # Save the data to a CSV file
-    df = pd.DataFrame(rows)
-    df.to_csv(out, header=False, index=False)
 
-    # Display and save errors and warnings
-    cr.errorlog(out_error, errors)
+# Load the trajectories saved by save_trajectories(), returning a dict with the arrays
+def load_trajectories(filename):
+    np = cr.numpy()
+    with np.load(filename) as data:
+        return {key: data[key] for key in data.files}
 
-    # Final message   
-    time_elapsed = round(time.time() - time_start, 1)
-    print("")
-    print("  Finished reading ", data_directory + "/.../" + data_castep, " files in " + str(time_elapsed) + " seconds")
-    print("  Data extracted and saved to ", out)
+
+def error_unknown_fields(unknown):
+    print("  ------------------------------------------------------------")
+    print("  ERROR:  Unknown fields:", " ".join(unknown))
+    print("  The available fields are:")
+    for key, field in castep_fields.items():
+        print("    " + key.ljust(16) + field_title(field))
+    print("  ------------------------------------------------------------")
     print("")
 
 
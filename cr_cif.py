@@ -20,9 +20,12 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 
 import os
+import re
+import io
 import time
+import functools
 import cr_common as cr
-import pandas as pd
+import cr_table
 
 
 ##################################################################
@@ -31,6 +34,8 @@ import pandas as pd
 # !!! IF YOU CHANGE THE HEADER, make sure to change the columns in the 'row = [...]' line, as well to comment the unnecesary 'searcher' and 'extract' lines. Full header is shown in the next comment for further reference:
 # header = ['filename', 'SSG_H_M', 'SSG_H_M-Efield']
 header = ['filename', 'SSG_H_M']
+# Type of each column of the header, for the tables of cr_table.py: 'float', 'category', 'bool' or 'text'
+types = ['text', 'category']
 # Run the main script for *.cif files at execution. Set to False to import the functions as a module.
 run_at_import = False
 # Rename the file_name in the xxx-xxx-xxx-xxx format, set to False to keep the original name
@@ -39,8 +44,9 @@ rename_files = False
 cry = 5
 # Omit, or not, all values from corrupted files
 safemode = False
-# Main program for reading cif files. Change the default arguments to run the script from the command line
-def main(data_directory='data', data_cif='cc-2-out.cif', out='out_cif.csv', out_error='errors_cif.txt'):
+# Main program for reading cif files. Change the default arguments to run the script from the command line. With 'table=True', the rows are also kept in memory as a cr_table.Table, which is returned
+# If a list of 'tags' is given, such as ['_cell_length_a', '_symmetry_space_group_name_H-M'], the files are parsed with read_cif() and the columns are the values of these tags, instead of the 'header' above. A 'budget' of seconds can be given for the whole job, as in cr.main_setup()
+def main(data_directory='data', data_cif='cc-2-out.cif', out='out_cif.csv', out_error='errors_cif.txt', workers=1, mmap_mode=False, cache=False, cache_clear=False, incremental=False, flush_interval=100, prefetch=0, index=False, stats=False, tags=None, table=False, budget=False):
 ##################################################################
 
     print("")
@@ -56,95 +62,342 @@ def main(data_directory='data', data_cif='cc-2-out.cif', out='out_cif.csv', out_
     print("  output file:         ", out)
     print("  error log:           ", out_error)
     print("  abortion time:       ", cry)
+    print("  budget:              ", budget)
     print("  safemode:            ", safemode)
+    print("  workers:             ", workers)
+    print("  mmap mode:           ", mmap_mode)
+    print("  cache:               ", cache)
+    print("  incremental:         ", incremental)
+    print("  flush interval:      ", flush_interval)
+    print("  prefetch:            ", prefetch)
+    print("  index:               ", index)
+    print("  stats:               ", stats)
+    print("  tags:                ", tags)
     print("")
 
-    # Get the absolute path to the directory containing the Python script
-    dir_path = os.path.dirname(os.path.realpath(__file__))
-    # Specify the path to the directory containing the folders with the .castep files, relative to the script's directory
-    path = os.path.join(dir_path, data_directory)
-    # Get the names of all the directories in the given path, and store them in a list
-    directories = [d for d in os.listdir(path) if os.path.isdir(os.path.join(path, d))]
+    columns = make_header(tags)
 
-    # Empty arrays to store the data
-    errors = []
-    rows = []
-    rows.append(header)
+    # Folders with the data files, the stats of the run and the deadline of the budget of the whole job
+    path, directories, data_cif, run_stats, job_deadline = cr.main_setup(data_directory, data_cif, out, index, stats, budget)
 
-    # Start a timer and counter, for the progress bar and warning messages
+    # Start a timer, for the final message
     time_start = time.time()
-    bar = time_start
-    loop = 0
-
-    # Loop through all the folders in the /data path
-    for directory in directories:
-
-        # Progress bar, just for fun
-        loop += 1
-        cr.progressbar(loop, len(directories), bar)
-        
-        # Define the path to the .cif files
-        file_cif = os.path.join(path, directory, data_cif)
-
-        # Check if the file exists
-        if not os.path.isfile(file_cif):
-            error = [file_name, 'missing file']
-            errors.append(error)
-            continue
-
-        # Rename, or not, the file_name in the xxx-xxx-xxx-xxx format
-        if rename_files == True:
-            file_name = cr.naming(directory)
-        else:
-            file_name = directory
-
-        # Read the file and look for the desired lines
-        symmetry_group_str = cr.searcher(file_cif, '_symmetry_space_group_name_H-M', cry)
-
-        # Extract the values from the strings
-        symmetry_group = cr.extract_str_commas(symmetry_group_str, '_symmetry_space_group_name_H-M')        
-
-        # Sometimes, '_symmetry_space_group_name_H-M' is written as '_symmetry_space_group_name_H_M'
-        # The following 'if' should handle this issue
-        if symmetry_group_str is None:
-            symmetry_group_str = cr.searcher(file_cif, '_symmetry_space_group_name_H_M', cry)
-            symmetry_group = cr.extract_str_commas(symmetry_group_str, '_symmetry_space_group_name_H_M')
-
-        ##################################################################
-        #       IF YOU MODIFIED THE HEADER, MODIFY THE COLUMNS TOO
-        ##################################################################
-        # Values to save. Full row in the following comment for further reference:
-        # row = [file_name, cif]
-        row = [file_name, symmetry_group]
-        ##################################################################
-
-        # ERRORS: Check if any of the values are missing
-        error = [file_name, ' missing value/s', ' safemode = ' + str(safemode)]
-        for i, var in enumerate(row):
-            if var is None:
-                errors.append(error)
-                bar = True
-                if safemode == True:
-                    row = [file_name]
-                break
-
-        rows.append(row)
-
-    print("")
-
-    # Save the data to a CSV file
-    df = pd.DataFrame(rows)
-    df.to_csv(out, header=False, index=False)
 
-    # Display and save errors and warnings
-    cr.errorlog(out_error, errors)
+    # Read the file in each folder of the /data path. The row of each folder is extracted by read_directory()
+    reader = functools.partial(read_directory, path=path, data_cif=data_cif, cry=cry, safemode=safemode, rename_files=rename_files, mmap_mode=mmap_mode, tags=tags, budget=job_deadline)
+    # The results of previous runs are only reused if they were extracted with the same header and settings
+    fields = str([cr.version(), columns, safemode, rename_files])
+    rows = cr_table.Table(columns, make_types(tags)) if table else None
+    messages = cr.main_loop(reader, directories, path, data_cif, columns, out, out_error, fields, workers, cache, cache_clear, incremental, flush_interval, prefetch, run_stats, rows)
 
     # Final message  
     time_elapsed = round(time.time() - time_start, 1)
     print("")
     print("  Finished reading ", data_directory + "/.../" + data_cif, " files in " + str(time_elapsed) + "s")
     print("  Data extracted and saved to ", out)
+    for message in messages:
+        print("  " + message)
     print("")
+    return rows
+
+
+# Columns of the output: the 'header' above, or the filename followed by the 'tags', if given
+def make_header(tags=None):
+    if tags:
+        return ['filename'] + list(tags)
+    return header
+
+
+# Type of each column of make_header(), for the tables of cr_table.py. The types of the tags are guessed from their values
+def make_types(tags=None):
+    if tags:
+        return ['text'] + [None] * len(tags)
+    return types
+
+
+# Read the .cif file of a single directory, returning the row of values and a list with the errors found.
+# It is called by main() for every directory, maybe from another process, so the parameters are passed as arguments
+def read_directory(directory, path, data_cif, cry=cry, safemode=safemode, rename_files=rename_files, mmap_mode=False, tags=None, budget=None):
+
+    # Define the path to the .cif files
+    file_cif = os.path.join(path, directory, data_cif)
+
+    # Rename, or not, the file_name in the xxx-xxx-xxx-xxx format
+    if rename_files == True:
+        file_name = cr.naming(directory)
+    else:
+        file_name = directory
+
+    # Check if the file exists
+    if not cr.file_exists(file_cif):
+        error = [file_name, 'missing file']
+        return None, [error]
+
+    return read_file(file_cif, file_name, cry, safemode, mmap_mode, tags, budget)
+
+
+# Read a .cif file, given by its name or as a binary file object, returning the row of values, starting with the 'file_name', and a list with the errors found.
+# The file gets 'cry' seconds, or less if the 'budget' of the job, given as a Deadline, ends before. The 'tags' are read in a single pass from the beginning, with the same time limit
+def read_file(file_cif, file_name, cry=cry, safemode=safemode, mmap_mode=False, tags=None, budget=None):
+
+    errors = []
+    deadline = cr.Deadline(cry, budget)
+
+    if tags:
+        return read_directory_tags(file_cif, file_name, tags, safemode, deadline)
+
+    # Read the file and look for the desired lines.
+    # Sometimes, '_symmetry_space_group_name_H-M' is written as '_symmetry_space_group_name_H_M', so both are searched in the same pass
+    found = cr.searcher_multi(file_cif, {'_symmetry_space_group_name_H-M': 0, '_symmetry_space_group_name_H_M': 0}, deadline, mmap_mode)
+
+    # Report how far the search got if the time was over
+    if deadline.expired:
+        errors.append([file_name, ' ' + deadline.report()])
+
+    # Extract the values from the strings
+    symmetry_group = cr.extract_str_commas(found['_symmetry_space_group_name_H-M'], '_symmetry_space_group_name_H-M')
+
+    # Use the '_symmetry_space_group_name_H_M' variant only if the standard one is missing
+    if found['_symmetry_space_group_name_H-M'] is None:
+        symmetry_group = cr.extract_str_commas(found['_symmetry_space_group_name_H_M'], '_symmetry_space_group_name_H_M')
+
+    ##################################################################
+    #       IF YOU MODIFIED THE HEADER, MODIFY THE COLUMNS TOO
+    ##################################################################
+    # Values to save. Full row in the following comment for further reference:
+    # row = [file_name, cif]
+    row = [file_name, symmetry_group]
+    ##################################################################
+
+    # ERRORS: Check if any of the values are missing
+    error = [file_name, ' missing value/s', ' safemode = ' + str(safemode)]
+    for i, var in enumerate(row):
+        if var is None:
+            errors.append(error)
+            if safemode == True:
+                row = [file_name]
+            break
+
+    return row, errors
+
+
+# Read the values of the 'tags' of a .cif file with read_cif(), for read_directory(). Numbers are saved as floats, without their uncertainty, and the values of the loops are joined with ';'.
+# Files with a loop that can not be split into rows give no values, and are reported as corrupted. If the 'deadline' is over, the tags found until then are kept, and the file is reported as timed out
+def read_directory_tags(file_cif, file_name, tags, safemode=safemode, deadline=None):
+    try:
+        values = read_cif(file_cif, tags, deadline)
+    except OSError:
+        return [file_name], [[file_name, ' unreadable file']]
+    except ValueError as error:
+        return [file_name], [[file_name, ' corrupted loop: ' + str(error)]]
+    row = [file_name]
+    errors = []
+    if deadline is not None and deadline.expired:
+        errors.append([file_name, ' ' + deadline.report()])
+    for tag in tags:
+        value = values.get(tag)
+        if value is not None and not isinstance(value, str):
+            value = ';'.join(str(x) for x in value)
+        elif value is not None:
+            number = cif_number(value)
+            if number is not None and number == number:
+                value = number
+        row.append(value)
+    if None in row:
+        errors.append([file_name, ' missing value/s', ' safemode = ' + str(safemode)])
+        if safemode == True:
+            row = [file_name]
+    return row, errors
+
+
+##################################################################
+#                    CIF TOKENIZER AND PARSER
+##################################################################
+# Lines parsed by tokens() between the checks of the time limit
+deadline_lines = 1000
+
+
+# A token of a cif file: a quoted value, a comment, which takes the rest of the line, or anything else up to the next whitespace.
+# Quoted values only end at a quote followed by a whitespace, so they can contain quotes, as in 'O'Neil'
+token_pattern = re.compile(r"""[ \t]*(?:'(.*?)'(?=\s|$)|"(.*?)"(?=\s|$)|(#).*|(\S+))""")
+# A number, with its standard uncertainty between brackets, as in '4.8012(3)'
+cif_number_pattern = re.compile(r'([+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)(?:\(\d+\))?')
+
+
+# Split the lines of a cif file into tokens, yielding (kind, text) pairs, where the kind is 'tag', 'loop', 'data' or 'value'.
+# Quoted values and the multi-line text fields between lines starting with ';' are always values, even if they look like tags. Comments are skipped, as well as the 'save_', 'global_' and 'stop_' keywords.
+# If a Deadline is given, it is checked every 'deadline_lines' lines, with the characters read so far as its progress, and the tokens stop when it is over
+def tokens(lines, deadline=None):
+    text = None
+    read = 0
+    for number, line in enumerate(lines):
+        if deadline is not None:
+            read += len(line)
+            if number % deadline_lines == 0:
+                deadline.progress(read)
+                if deadline.check():
+                    return
+        line = line.rstrip('\r\n')
+        # Multi-line text field, between two lines starting with ';'
+        if text is not None:
+            if line.startswith(';'):
+                # The first line is usually empty, with only the ';'
+                if not text[0]:
+                    text.pop(0)
+                yield 'value', '\n'.join(text)
+                text = None
+                line = line[1:]
+            else:
+                text.append(line)
+                continue
+        elif line.startswith(';'):
+            text = [line[1:]]
+            continue
+        for match in token_pattern.finditer(line):
+            quoted, double_quoted, comment, word = match.groups()
+            if comment:
+                break
+            if quoted is not None:
+                yield 'value', quoted
+            elif double_quoted is not None:
+                yield 'value', double_quoted
+            elif word is not None:
+                lower = word.lower()
+                if lower.startswith('_'):
+                    yield 'tag', word
+                elif lower == 'loop_':
+                    yield 'loop', word
+                elif lower.startswith('data_'):
+                    yield 'data', word
+                elif not lower.startswith(('save_', 'global_', 'stop_')):
+                    yield 'value', word
+    # A text field that never ends is returned as it is
+    if text is not None:
+        yield 'value', '\n'.join(text)
+
+
+# Number of a cif value, without its uncertainty: 4.8012(3) is 4.8012. The '.' and '?' values, for inapplicable and unknown, are NaN. Returns None if the value is not a number
+def cif_number(value):
+    if value in ('.', '?'):
+        return float('nan')
+    match = cif_number_pattern.fullmatch(value)
+    if match is None:
+        return None
+    return float(match.group(1))
+
+
+# Column of a loop as a NumPy array: of floats if all the values are numbers, '.' or '?', or of strings otherwise. It is a list of strings if NumPy is not installed
+def loop_column(values):
+    np = cr.numpy()
+    if np is None:
+        return values
+    numbers = [cif_number(value) for value in values]
+    if values and None not in numbers:
+        return np.array(numbers, dtype=float)
+    return np.array(values, dtype=str)
+
+
+# Read the values of the requested 'tags' of a .cif file, in a single pass from the beginning of the file, which stops as soon as all of them are found.
+# 'file' is the name of the file, or a file object open in text or binary mode. The tags are case-insensitive, as in the cif format, and a tag ending with '_', such as '_atom_site_', stands for all the tags starting with it. All the tags are read if 'tags' is None.
+# Returns a dict as {tag: value}, with the tags as written in 'tags', or as written in the file for the ones matched by a prefix or when reading all of them. Single values are strings, and the columns of the loops are arrays, as returned by loop_column(). Only the first data block is read.
+# Raises ValueError if the number of values of a loop with any of the tags is not a multiple of its number of columns, since its rows can not be told apart.
+# If a Deadline is given, it is checked every 'deadline_lines' lines, and the tags found until it is over are returned
+def read_cif(file, tags=None, deadline=None):
+    if deadline is not None:
+        deadline.from_end = False
+    if hasattr(file, 'read'):
+        if isinstance(file.read(0), str):
+            return parse_cif(file, tags, deadline)
+        text = io.TextIOWrapper(file, encoding='utf-8', errors='replace')
+        try:
+            return parse_cif(text, tags, deadline)
+        finally:
+            # The file object is left open for the caller
+            text.detach()
+    with cr.measure(cr.instruments, 'open'):
+        raw = cr.filesystem.open(file)
+    if deadline is not None:
+        deadline.progress(0, os.fstat(raw.fileno()).st_size)
+    with io.TextIOWrapper(raw, encoding='utf-8', errors='replace') as text:
+        result = parse_cif(text, tags, deadline)
+        cr.count_bytes(raw.tell())
+    return result
+
+
+# Parse the lines of a cif file for read_cif()
+def parse_cif(lines, tags=None, deadline=None):
+    # Requested tags, in lowercase, and the prefixes that stand for all the tags starting with them
+    names = {}
+    prefixes = []
+    for tag in tags or []:
+        if tag.endswith('_'):
+            prefixes.append(tag.lower())
+        else:
+            names[tag.lower()] = tag
+    prefixes = tuple(prefixes)
+    pending = set(names)
+
+    # Key of a tag in the result, or None if it was not requested
+    def key(tag):
+        lower = tag.lower()
+        if lower in names:
+            return names[lower]
+        if tags is None or lower.startswith(prefixes):
+            return tag
+        return None
+
+    result = {}
+    blocks = 0
+    # Tag waiting for its value
+    tag = None
+    # Keys of the columns of the loop being read, None for the ones not requested, and the values of all of them, row after row
+    columns = None
+    values = []
+
+    def end_loop():
+        requested = [column for column in columns if column is not None]
+        if requested and len(values) % len(columns):
+            raise ValueError("the loop of {} has {} values for {} columns".format(requested[0], len(values), len(columns)))
+        for i, column in enumerate(columns):
+            if column is not None and column not in result:
+                result[column] = loop_column(values[i::len(columns)])
+                pending.discard(column.lower())
+
+    with cr.measure(cr.instruments, 'search'):
+        for kind, text in tokens(lines, deadline):
+            if kind == 'value':
+                if columns:
+                    values.append(text)
+                elif tag is not None:
+                    if key(tag) is not None and key(tag) not in result:
+                        result[key(tag)] = text
+                        pending.discard(tag.lower())
+                    tag = None
+                continue
+            # The names of the columns go right after 'loop_', and any other token after the values ends the loop
+            if kind == 'tag' and columns is not None and not values:
+                columns.append(key(text))
+                continue
+            if columns is not None:
+                end_loop()
+                columns = None
+                values = []
+            if tags is not None and not pending and not prefixes:
+                break
+            tag = None
+            if kind == 'tag':
+                tag = text
+            elif kind == 'loop':
+                columns = []
+            elif kind == 'data':
+                blocks += 1
+                if blocks > 1:
+                    break
+        else:
+            # A loop cut by the deadline is not kept, since its last row may be incomplete
+            if columns and not (deadline is not None and deadline.expired):
+                end_loop()
+    return result
 
 
 if run_at_import:
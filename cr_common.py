@@ -20,18 +20,30 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 
 
+# The version is part of the settings of the cache, incremental outputs and index files, so it must change whenever the values extracted from the files change, so that the rows saved by older versions are read again
 def version():
-    return "vCR.2023.12.11.1900"
+    return "vCR.2026.10.18.1200"
 
 
 
 import re
 import time
+import collections
+import functools
+import mmap
+import itertools
+import fnmatch
+import stat
 import os
-import pandas as pd
-import cr_castep as castep
-import cr_cif as cif
-import cr_phonon as phonon
+import csv
+import json
+import shutil
+import contextlib
+import traceback
+import queue
+import sys
+import importlib
+import cr_cache
 
 
 
@@ -50,24 +62,64 @@ def naming(string):
         return None
 
 
+# Number of compiled patterns kept by each of the extract functions, one per variable name. The least recently used ones are discarded when there are more
+pattern_cache_size = 512
+# Regular expression of a number
+number_pattern = r'(-?\d+(?:\.\d+)?(?:[eE][+\-]?\d+)?)'
+
+
+# Compiled patterns of the extract functions, so that the pattern of each variable name is only compiled once
+@functools.lru_cache(maxsize=pattern_cache_size)
+def float_pattern(name):
+    return re.compile(name + r'\s*=?\s*' + number_pattern)
+
+
+@functools.lru_cache(maxsize=pattern_cache_size)
+def str_pattern(name):
+    return re.compile(name + r"\s*=\s*(\S.*)?$")
+
+
+@functools.lru_cache(maxsize=pattern_cache_size)
+def str_commas_pattern(name):
+    return re.compile(name + r"\s*(=)?\s*['\"](.*?)(?=['\"]|$)")
+
+
+# Empty the caches of compiled patterns, to free the memory or after changing 'pattern_cache_size'
+def clear_patterns():
+    global float_pattern, str_pattern, str_commas_pattern
+    float_pattern = functools.lru_cache(maxsize=pattern_cache_size)(float_pattern.__wrapped__)
+    str_pattern = functools.lru_cache(maxsize=pattern_cache_size)(str_pattern.__wrapped__)
+    str_commas_pattern = functools.lru_cache(maxsize=pattern_cache_size)(str_commas_pattern.__wrapped__)
+
+
 # This function will extract the float value of a given variable from a raw string
 def extract_float(string, name):
     if string == None:
         return None
-    pattern = re.compile(name + r'\s*=?\s*(-?\d+(?:\.\d+)?(?:[eE][+\-]?\d+)?)')
-    match = pattern.search(string)
+    match = float_pattern(name).search(string)
     if match:
         return float(match.group(1))
     else:
         return None
-    
+
+
+# Same as extract_float(), but for several variables of the same string, such as ['a', 'alpha']. Returns the list of values, with None for the ones not found.
+# Each name is searched with its own cached pattern, which is faster than a single pattern with all the names for the short lines of these files, see 'python cr_benchmark.py extract'
+def extract_floats(string, names):
+    if string == None:
+        return [None] * len(names)
+    values = []
+    for name in names:
+        match = float_pattern(name).search(string)
+        values.append(float(match.group(1)) if match else None)
+    return values
+
 
 # This function will extract the string value of a given variable from a raw string
 def extract_str(string, name):
     if string == None:
         return None
-    pattern = re.compile(name + r"\s*=\s*(\S.*)?$")
-    match = pattern.search(string)
+    match = str_pattern(name).search(string)
     if match:
         return match.group(1).strip()
     else:
@@ -78,8 +130,7 @@ def extract_str(string, name):
 def extract_str_commas(string, name):
     if string == None:
         return None
-    pattern = re.compile(name + r"\s*(=)?\s*['\"](.*?)(?=['\"]|$)")
-    match = pattern.search(string)
+    match = str_commas_pattern(name).search(string)
     if match:
         return match.group(2).strip()
     else:
@@ -99,38 +150,758 @@ def extract_column(string, column):
     return None
 
 
-# This function will search for a specific string value in a given file, return the matching line, and optionally also return a specific number of lines following the match
-def searcher(filename, search_value, time_limit=False, number_rows=0):
-    with open(filename, 'r') as file:
-        # Move the file pointer to the end of the file
+# This function will read the values of the requested fields of a file. The 'registry' is a dict of fields, each with the 'search' line, the number of 'rows' after it and the function to 'extract' the value, as in cr_castep.
+# Only the lines needed by the requested fields are searched, all of them in a single pass. Returns the list of values, with None for the missing ones. The 'time_limit' can be given in seconds or as a Deadline
+def read_fields(filename, registry, fields, time_limit=False, mmap_mode=False, window=None):
+    search_values = {}
+    for field in fields:
+        search_values[registry[field].search] = registry[field].rows
+    found = searcher_multi(filename, search_values, time_limit, mmap_mode, window)
+    return [registry[field].extract(found[registry[field].search]) for field in fields]
+
+
+# This function will read a file backwards, in blocks of 'block_size' bytes, yielding its lines from the last one to the first one
+def reverse_lines(filename, block_size=65536):
+    for line in reverse_byte_lines(filename, block_size):
+        yield line.decode()
+
+
+# Biggest block read at once by reverse_byte_lines() when the blocks grow, so that the memory used stays bounded
+max_block_size = 16777216
+
+
+# Same as reverse_lines(), but yielding the lines as bytes, without decoding them.
+# Each block is 'step' times bigger than the previous one, up to 'max_block_size', and only the last 'limit' bytes of the file are read if a limit is given, without the first line, which may be cut.
+# The 'filename' can also be a seekable binary file object, which is read from its end and left open. If a 'deadline' is given, it is checked before reading each block, and the lines stop when it is over
+def reverse_byte_lines(filename, block_size=65536, limit=None, step=1, deadline=None):
+    if hasattr(filename, 'read'):
+        file = contextlib.nullcontext(filename)
+    else:
+        with measure(instruments, 'open'):
+            file = filesystem.open(filename)
+    with file as file:
         file.seek(0, 2)
-        # Get the position of the file pointer
         position = file.tell()
-        lines = []
-        time_start = time.time() # record the start time
-        while position >= 0 and len(lines) < number_rows+1:
-            # Check if the elapsed time exceeds the specified time limit
-            if time_limit and time.time() - time_start > time_limit:
-                return None
+        end = position
+        # The bytes before this position are not read
+        stop = 0 if limit is None else max(0, position - limit)
+        # Beginning of a line that may continue in the previous block
+        remainder = b''
+        while position > stop:
+            if deadline is not None:
+                deadline.progress(end - position, end)
+                if deadline.check():
+                    return
+            size = min(block_size, position - stop)
+            block_size = min(block_size * step, max(block_size, max_block_size))
+            position -= size
             file.seek(position)
-            next_char = file.read(1)
-            if next_char == '\n':
-                line = file.readline().strip()
+            with measure(instruments, 'read'):
+                block = file.read(size)
+            count_bytes(len(block))
+            lines = (block + remainder).split(b'\n')
+            remainder = lines[0]
+            yield from reversed(lines[1:])
+        if position == 0:
+            yield remainder
+
+
+# This function will search for a specific string value in a given file, return the matching line, and optionally also return a specific number of lines following the match.
+# If the search takes longer than 'time_limit' seconds, it stops and returns None. The 'time_limit' can also be a Deadline, shared with other searches of the same file
+def searcher(filename, search_value, time_limit=False, number_rows=0, mmap_mode=False, window=None):
+    return searcher_multi(filename, {search_value: number_rows}, time_limit, mmap_mode, window)[search_value]
+
+
+# Time budget of a file, shared by all the searches of the file, instead of a new time limit for each one. 'seconds' can be False or None for no limit.
+# It is checked between the blocks read, not for every line. The end is kept as a wall-clock time, so that a deadline means the same when it is sent to other processes, as with 'workers'.
+# A 'parent' deadline, such as the budget of a whole job, also ends this one
+class Deadline:
+
+    def __init__(self, seconds=None, parent=None):
+        self.start = time.time()
+        self.end = self.start + seconds if seconds else None
+        if parent is not None and parent.end is not None and (self.end is None or parent.end < self.end):
+            self.end = parent.end
+        # Whether a search was stopped by the deadline, and how far the searches got, in bytes from the end of a file of 'size' bytes, or from its start if 'from_end' is False, as with the cif tags
+        self.expired = False
+        self.searched = 0
+        self.size = 0
+        self.from_end = True
+
+    # Check if the time is over, which is remembered
+    def check(self):
+        if not self.expired and self.end is not None and time.time() > self.end:
+            self.expired = True
+        return self.expired
+
+    def progress(self, searched, size=None):
+        self.searched = max(self.searched, searched)
+        if size is not None:
+            self.size = size
+
+    # How far the search got when the time was over, for the error log
+    def report(self):
+        if self.start >= self.end:
+            return 'timed out before reading it as the budget was over'
+        return 'timed out after {:.1f}s with {:.1f} of {:.1f} MB searched from the {}'.format(time.time() - self.start, self.searched / 1e6, self.size / 1e6, 'end' if self.from_end else 'start')
+
+
+# Deadline of a search: the given Deadline, a new one for 'time_limit' seconds, or None if there is no time limit
+def as_deadline(time_limit):
+    if isinstance(time_limit, Deadline):
+        return time_limit
+    if time_limit:
+        return Deadline(time_limit)
+    return None
+
+
+# Part of the end of a file to search, instead of a time limit: the last 'size' bytes are searched first, and then blocks 'step' times bigger each time, while some values are missing, up to 'cap' bytes from the end of the file, or the whole file if 'cap' is None.
+# The cost of a search then only depends on the file, not on the load of the machine
+Window = collections.namedtuple('Window', ['size', 'step', 'cap'])
+
+
+# Same as searcher(), but for several search values at once. 'search_values' is a dict as {search_value: number_rows}, and a dict as {search_value: result} is returned, with None for the values not found.
+# The file is read only once, from the end until all values are found. With mmap_mode=True the file is memory-mapped and searched with search_buffer(), falling back to the usual reading if it can not be mapped.
+# If a 'window' is given, only the part of the end of the file within its cap is searched. The 'filename' can also be a seekable binary file object, and the 'time_limit' a Deadline
+def searcher_multi(filename, search_values, time_limit=False, mmap_mode=False, window=None):
+    with measure(instruments, 'search'):
+        return search_tail(filename, search_values, time_limit, mmap_mode, window)
+
+
+# Search the end of the file read by prefetch_files() for searcher_multi(), if available, and then the whole file
+def search_tail(filename, search_values, time_limit=False, mmap_mode=False, window=None):
+    # The search of the prefetched end and of the rest of the file share the same deadline
+    time_limit = as_deadline(time_limit)
+    # If the end of the file was already read by prefetch_files(), it is searched first, and the file is only read for the values not found there
+    tail = prefetched.get(filename)
+    if tail is not None:
+        offset, data = tail
+        count_bytes(len(data))
+        results = search_buffer(data, search_values, time_limit, window)
+        missing = {search_value: number_rows for search_value, number_rows in search_values.items() if results[search_value] is None}
+        if missing and offset > 0 and (window is None or window.cap is None or window.cap > len(data)):
+            results.update(search_file(filename, missing, time_limit, mmap_mode, window))
+        return results
+    return search_file(filename, search_values, time_limit, mmap_mode, window)
+
+
+# Search the whole file for searcher_multi(), from the end. File objects are never memory-mapped
+def search_file(filename, search_values, time_limit=False, mmap_mode=False, window=None):
+    if mmap_mode and not hasattr(filename, 'read'):
+        with measure(instruments, 'open'):
+            file = filesystem.open(filename)
+        with file:
+            try:
+                with measure(instruments, 'open'):
+                    buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                # Empty files, pipes and some network filesystems can not be mapped
+                buffer = None
+            if buffer is not None:
+                # The pages of the file are read as they are searched, so the read time is part of the search, and the whole file is counted as read
+                count_bytes(len(buffer))
+                with buffer:
+                    return search_buffer(buffer, search_values, as_deadline(time_limit), window)
+    results = dict.fromkeys(search_values)
+    # The lines are compared as bytes with the encoded search values, and only the lines found are decoded
+    pending = {search_value.encode(): (search_value, number_rows) for search_value, number_rows in search_values.items()}
+    needles = tuple(pending)
+    # Lines already read from the tail, that is, the lines following the current one
+    following = collections.deque(maxlen=max(search_values.values(), default=0))
+    # The time is only checked between the blocks read, not for every line
+    deadline = as_deadline(time_limit)
+    if window is None:
+        lines = reverse_byte_lines(filename, deadline=deadline)
+    else:
+        lines = reverse_byte_lines(filename, window.size, window.cap, window.step, deadline)
+    for line in lines:
+        line = line.strip()
+        if line.startswith(needles):
+            for needle, (search_value, number_rows) in list(pending.items()):
+                if not line.startswith(needle):
+                    continue
+                if number_rows == 0:
+                    results[search_value] = line.decode()
+                else:
+                    results[search_value] = [line.decode()] + [next_line.decode() for next_line in list(following)[:number_rows] if next_line]
+                del pending[needle]
+            if not pending:
+                break
+            needles = tuple(pending)
+        following.appendleft(line)
+    return results
+
+
+# Same as searcher_multi(), but searching a bytes-like buffer, such as a memory-mapped file, instead of reading the file line by line.
+# Each value is looked for with rfind() from the end of the buffer, and a hit is only accepted if it is at the start of a line, so nothing is copied until a match is found.
+# With a 'window', only the full lines within its cap from the end of the buffer are searched
+def search_buffer(buffer, search_values, time_limit=False, window=None):
+    results = dict.fromkeys(search_values)
+    start = 0
+    if window is not None and window.cap is not None and window.cap < len(buffer):
+        start = buffer.find(b'\n', len(buffer) - window.cap) + 1 or len(buffer)
+    deadline = as_deadline(time_limit)
+    for search_value, number_rows in search_values.items():
+        needle = search_value.encode()
+        end = len(buffer)
+        while True:
+            # The time is checked before each look for the value, which may go through the whole buffer
+            if deadline is not None:
+                deadline.progress(len(buffer) - end, len(buffer))
+                if deadline.check():
+                    return results
+            hit = buffer.rfind(needle, start, end)
+            if hit < 0:
+                if deadline is not None:
+                    deadline.progress(len(buffer) - start, len(buffer))
+                break
+            line_start = buffer.rfind(b'\n', 0, hit) + 1
+            # Only whitespaces are allowed between the start of the line and the hit
+            if blank_pattern.fullmatch(buffer, line_start, hit):
+                line_end = buffer.find(b'\n', hit)
+                if line_end < 0:
+                    line_end = len(buffer)
+                line = buffer[line_start:line_end].decode().strip()
                 if line.startswith(search_value):
                     if number_rows == 0:
-                        return line
-                    lines.append(line)
-                    for i in range(number_rows):
-                        next_line = file.readline().strip()
-                        if next_line:
-                            lines.append(next_line)
+                        results[search_value] = line
+                    else:
+                        results[search_value] = [line] + [next_line for next_line in buffer_lines(buffer, line_end + 1, number_rows) if next_line]
                     break
-            position -= 1
-    return None if not lines else lines[::1]
+            # Keep looking before this hit
+            end = hit + len(needle) - 1
+    return results
+
+
+blank_pattern = re.compile(rb'[ \t\r\f\v]*')
+
+
+# This function will return a list with the next 'number_rows' lines of a buffer after the 'position' byte, stripped and decoded
+def buffer_lines(buffer, position, number_rows):
+    lines = []
+    for i in range(number_rows):
+        if position > len(buffer):
+            break
+        line_end = buffer.find(b'\n', position)
+        if line_end < 0:
+            line_end = len(buffer)
+        lines.append(buffer[position:line_end].decode().strip())
+        position = line_end + 1
+    return lines
+
+
+# Find the folders inside 'path' with the data files. Returns the list of folders, relative to 'path', and the name of the data files.
+# 'data_file' can be the name of the files, inside each folder of 'path', or a pattern of folders ending in the name of the files, such as '*/*/cc-2.castep', where '**' stands for any number of folders, as in 'calc-*/**/cc-2.castep'.
+# All the folders matching a pattern are returned, so that the missing files are reported, except for '**' patterns, where only the folders with the file are returned.
+# If an 'index' file is given, the folders found are saved to it, and reused while the modification times of the folders read are the same
+def find_directories(path, data_file, index=False):
+    parts = data_file.replace('\\', '/').split('/')
+    name = parts[-1]
+    patterns = parts[:-1] or ['*']
+    if index:
+        directories = load_index(index, path, data_file)
+        if directories is not None:
+            return directories, name
+    directories = []
+    # Modification times of the folders read, only needed for the index
+    scanned = {} if index else None
+    scan_directories(path, '', patterns, name, directories, scanned)
+    if index:
+        save_index(index, path, data_file, directories, scanned)
+    return directories, name
+
+
+# Add to 'directories' the folders inside 'path/relative' that match the 'patterns', one for each level, with os.scandir(), which does not need an extra stat call to know which entries are folders.
+# The modification times of the folders read are added to 'scanned', unless it is None. The links to folders are not followed by '**', as in os.walk(), so that links to a parent folder do not loop forever
+def scan_directories(path, relative, patterns, name, directories, scanned):
+    if not patterns:
+        directories.append(relative or '.')
+        return
+    folder = os.path.join(path, relative)
+    try:
+        if scanned is not None:
+            scanned[relative] = os.stat(folder).st_mtime_ns
+        with os.scandir(folder) as entries:
+            entries = list(entries)
+    except OSError:
+        return
+    if patterns[0] == '**':
+        # '**' also matches no folder at all
+        if len(patterns) == 1:
+            if any(entry.name == name and is_entry(entry, 'is_file') for entry in entries):
+                # A file in 'path' itself is in the folder '.', so that its filename is not empty
+                directories.append(relative or '.')
+        else:
+            scan_directories(path, relative, patterns[1:], name, directories, scanned)
+        for entry in entries:
+            if is_entry(entry, 'is_dir', follow_symlinks=False):
+                scan_directories(path, os.path.join(relative, entry.name), patterns, name, directories, scanned)
+        return
+    for entry in entries:
+        if fnmatch.fnmatchcase(entry.name, patterns[0]) and is_entry(entry, 'is_dir'):
+            scan_directories(path, os.path.join(relative, entry.name), patterns[1:], name, directories, scanned)
+
+
+# Check an entry of os.scandir() with its 'is_dir' or 'is_file' method, which may need a stat call that fails, as with broken links or removed files. Those entries are skipped
+def is_entry(entry, check, follow_symlinks=True):
+    try:
+        return getattr(entry, check)(follow_symlinks=follow_symlinks)
+    except OSError:
+        return False
+
+
+# Folders saved in an index file by find_directories(), or None if the index is missing, is malformed, is for other folders, or any of the folders read changed since then
+def load_index(index, path, data_file):
+    try:
+        with open(index, 'r') as f:
+            saved = json.load(f)
+        if saved.get('version') != version() or saved.get('path') != path or saved.get('data_file') != data_file:
+            return None
+        for relative, mtime in saved['scanned'].items():
+            if os.stat(os.path.join(path, relative)).st_mtime_ns != mtime:
+                return None
+        directories = saved['directories']
+        if not isinstance(directories, list) or not all(isinstance(directory, str) for directory in directories):
+            return None
+    except (OSError, ValueError, KeyError, AttributeError, TypeError):
+        return None
+    return directories
+
+
+# Save the folders found by find_directories() to an index file, with the modification times of the folders read
+def save_index(index, path, data_file, directories, scanned):
+    with open(index + '.tmp', 'w') as f:
+        json.dump({'version': version(), 'path': path, 'data_file': data_file, 'scanned': scanned, 'directories': directories}, f)
+    os.replace(index + '.tmp', index)
+
+
+# Operations on the files, used to read them and by the prefetch stage. It can be replaced by a slower stand-in, to simulate network filesystems, as in cr_benchmark.py
+class FileSystem:
+
+    def open(self, filename):
+        return open(filename, 'rb')
+
+    def stat(self, filename):
+        return os.stat(filename)
+
+
+filesystem = FileSystem()
+# Bytes read from the end of each file by prefetch_files()
+prefetch_size = 262144
+# Files read by prefetch_files() that are waiting to be searched, as {filename: (offset, data)}, with None for the missing files
+prefetched = {}
+# Seconds that the main thread waited for the prefetch of the file being processed, which measured_reader() counts as its 'read' stage
+prefetch_wait = 0.0
+
+
+# Check if a file exists, using the stat of prefetch_files() if available
+def file_exists(filename):
+    if filename in prefetched:
+        return prefetched[filename] is not None
+    try:
+        with measure(instruments, 'open'):
+            return stat.S_ISREG(filesystem.stat(filename).st_mode)
+    except OSError:
+        return False
+
+
+# Read the stat and the last 'prefetch_size' bytes of a file. Returns (offset, data), where the data starts at the first full line, or None if the file does not exist
+def read_tail(filename):
+    try:
+        file_stat = filesystem.stat(filename)
+        if not stat.S_ISREG(file_stat.st_mode):
+            return None
+        with filesystem.open(filename) as file:
+            offset = max(0, file_stat.st_size - prefetch_size)
+            file.seek(offset)
+            data = file.read()
+    except OSError:
+        return None
+    if offset > 0:
+        # The first line may be cut, so it is left for the full search. If the whole tail is part of a single line, none of it is kept
+        newline = data.find(b'\n')
+        data = data[newline + 1:] if newline >= 0 else b''
+    return offset, data
+
+
+# Yield the items in the same order, while a pool of 'depth' threads reads ahead the stat and the end of their files with read_tail(), at most 'depth' files ahead.
+# Each file is kept in 'prefetched' while its item is being processed, so that file_exists() and searcher_multi() do not wait for the filesystem again. The time waiting for each file is kept in 'prefetch_wait'
+def prefetch_files(items, filenames, depth):
+    global prefetch_wait
+    pending = collections.deque()
+    files = zip(items, filenames)
+    import concurrent.futures
+    with concurrent.futures.ThreadPoolExecutor(max_workers=depth) as executor:
+        for item, filename in itertools.islice(files, depth):
+            pending.append((item, filename, executor.submit(read_tail, filename)))
+        while pending:
+            item, filename, future = pending.popleft()
+            for next_item, next_filename in itertools.islice(files, 1):
+                pending.append((next_item, next_filename, executor.submit(read_tail, next_filename)))
+            time_start = time.perf_counter()
+            prefetched[filename] = future.result()
+            prefetch_wait = time.perf_counter() - time_start
+            try:
+                yield item
+            finally:
+                del prefetched[filename]
+
+
+# This function will call function(item) for every item, with a pool of 'workers' processes if workers > 1, yielding the results in the same order as the items
+def pool_map(function, items, workers=1):
+    if workers <= 1 or len(items) <= 1:
+        for item in items:
+            yield function(item)
+        return
+    # Small chunks, so that the progress bar keeps moving
+    chunksize = max(1, len(items) // (workers * 20))
+    import concurrent.futures
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(function, items, chunksize=chunksize)
+
+
+# Directories to read, with their files prefetched by 'prefetch' threads if prefetch > 0. The prefetched files are only seen by the main process, so they are not used with workers > 1, where each process already waits for its own files
+def prefetch_directories(directories, path, data_file, workers=1, prefetch=0):
+    if prefetch <= 0 or workers > 1:
+        return directories
+    return prefetch_files(directories, [os.path.join(path, directory, data_file) for directory in directories], prefetch)
+
+
+# This function will yield the (row, errors) results of reader(directory) for every directory, in the same order, in parallel if workers > 1.
+# If a cache is given, the files that did not change since the last time are not read again. Files with errors are never stored, since they may be unfinished or timed out.
+# If 'run_stats' are given, the stages of every file read are added to them
+def read_directories(reader, directories, path, data_file, workers=1, cache=None, fields='', prefetch=0, run_stats=None):
+    if run_stats is not None:
+        reader = functools.partial(measured_reader, reader)
+    if cache is None:
+        yield from measured_results(pool_map(reader, prefetch_directories(directories, path, data_file, workers, prefetch), workers), run_stats)
+        return
+    files = [os.path.join(path, directory, data_file) for directory in directories]
+    stats = [cr_cache.file_stat(file) for file in files]
+    cached = [cache.get(file, file_stat, fields) if file_stat else None for file, file_stat in zip(files, stats)]
+    # Only the directories that are not in the cache are read
+    results = measured_results(pool_map(reader, prefetch_directories([directory for directory, result in zip(directories, cached) if result is None], path, data_file, workers, prefetch), workers), run_stats)
+    for file, file_stat, result in zip(files, stats, cached):
+        if result is None:
+            result = next(results)
+            row, errors = result
+            if file_stat is not None and not errors:
+                cache.put(file, file_stat, fields, result)
+        yield result
+
+
+# Setup shared by the main() functions of the castep, cif, phonon and folder scripts, before main_loop(). Returns (path, directories, data_file, run_stats, job_deadline):
+# the 'path' to the 'data_directory', relative to the folder of the scripts, the folders with the 'data_file' and its name, as returned by find_directories(), saved to the 'index' file if given, or next to 'out' if index is True,
+# the Stats of the run if 'stats' are requested, and the Deadline of the 'budget' of seconds for the whole job, or None. When the budget is over, the files being read stop and the rest are not read, and all of them are reported as timed out
+def main_setup(data_directory, data_file, out, index=False, stats=False, budget=False):
+    path = os.path.join(os.path.dirname(os.path.realpath(__file__)), data_directory)
+    job_deadline = Deadline(budget) if budget else None
+    if index is True:
+        index = os.path.splitext(out)[0] + '_index.json'
+    run_stats = Stats(stats, out) if stats else None
+    with measure(run_stats, 'list'):
+        directories, data_file = find_directories(path, data_file, index)
+    return path, directories, data_file, run_stats, job_deadline
+
+
+# This function will run the main loop of the castep, cif and phonon scripts: read the file of every directory with reader(directory), display the progress bar, save the rows to the 'out' CSV file and the errors to the 'out_error' log.
+# 'fields' must change whenever the columns or the settings of the rows change, so that the results of previous runs are not reused with different settings. Returns a list of messages for the final summary
+# If 'run_stats' are given, the time of each stage is recorded, and a summary is added to the messages. If a cr_table.Table is given as 'table', the rows are also added to it
+def main_loop(reader, directories, path, data_file, header, out, out_error, fields, workers=1, cache=False, cache_clear=False, incremental=False, flush_interval=100, prefetch=0, run_stats=None, table=None):
+    messages = []
+
+    # Open the cache with the results of previous runs, if any
+    results_cache = None
+    if cache:
+        results_cache = cr_cache.Cache(cache)
+        if cache_clear:
+            results_cache.invalidate(os.path.join(path, ''))
+
+    # In incremental mode, the rows of the previous output are kept for the files that did not change since then
+    previous = {}
+    stats = {}
+    unchanged = {}
+    if incremental:
+        previous = load_state(out, header, fields)
+        stats = {directory: cr_cache.file_stat(os.path.join(path, directory, data_file)) for directory in directories}
+        # The directories from the previous output go first, in the same order, followed by the new ones
+        order = {directory: i for i, directory in enumerate(previous)}
+        directories = sorted(directories, key=lambda directory: order.get(directory, len(order)))
+        # Files with errors are always read again, since they may be unfinished calculations
+        for directory in directories:
+            if directory in previous and stats[directory] is not None and previous[directory]['stat'] == list(stats[directory]) and not previous[directory]['errors']:
+                unchanged[directory] = previous[directory]
+
+    # Empty arrays to store the errors, the rows of the directories that are not in the previous output, and the state for the next incremental run
+    errors = []
+    new_rows = []
+    state = []
+    # The previous output must be rewritten if any of its rows changed, or if any of its folders is gone
+    rewrite = not previous or not set(previous).issubset(directories)
+
+    # The rows are saved to the CSV file as soon as they are read. In incremental mode they are saved to a temporary file, which replaces the previous output at the end if needed
+    writer = StreamWriter(out + '.tmp' if incremental else out, len(header), flush_interval)
+    writer.write(header)
+
+    # Start a timer and counter, for the progress bar and warning messages
+    time_start = time.time()
+    bar = time_start
+    loop = 0
+
+    # Loop through all the folders in the /data path, reading them in parallel if workers > 1, and skipping the files in the cache. The results come back in the same order as the directories
+    results = read_directories(reader, [directory for directory in directories if directory not in unchanged], path, data_file, workers, results_cache, fields, prefetch, run_stats)
+    for directory in directories:
+        if directory in unchanged:
+            row, row_errors = unchanged[directory]['row'], []
+        else:
+            row, row_errors = next(results)
+
+        # A missing file returns no row, and it is not displayed until the end
+        errors.extend(row_errors)
+        if row is not None:
+            if row_errors:
+                bar = True
+            with measure(run_stats, 'write'):
+                writer.write(row)
+                if table is not None:
+                    table.append(row)
+        if incremental:
+            if directory not in previous:
+                if row is not None:
+                    new_rows.append(row)
+            elif csv_strings(row, len(header)) != previous[directory]['row']:
+                rewrite = True
+            state.append([directory, stats[directory], row is not None, row_errors])
+
+        # Progress bar, just for fun
+        loop += 1
+        progressbar(loop, len(directories), bar)
+
+    print("")
+    writer.close()
+
+    # In incremental mode, if the previous rows did not change, the new rows are appended at the end of the previous output
+    if incremental:
+        if rewrite:
+            os.replace(out + '.tmp', out)
+        else:
+            os.remove(out + '.tmp')
+            if new_rows:
+                writer = StreamWriter(out, len(header), flush_interval, mode='a')
+                for row in new_rows:
+                    writer.write(row)
+                writer.close()
+    if incremental:
+        save_state(out, header, fields, state)
+        if rewrite:
+            written = "output rewritten"
+        elif new_rows:
+            written = str(len(new_rows)) + " rows appended to the output"
+        else:
+            written = "output unchanged"
+        messages.append("Incremental: " + str(len(unchanged)) + " rows kept, " + str(len(directories) - len(unchanged)) + " files read, " + written)
+
+    # Display and save errors and warnings
+    with measure(run_stats, 'write'):
+        errorlog(out_error, errors)
+
+    if results_cache is not None:
+        results_cache.close()
+        messages.append("Cache: " + str(results_cache.hits) + " files reused, " + str(results_cache.misses) + " files read, stored at " + cache)
+    if run_stats is not None:
+        messages.extend(run_stats.summary())
+        if run_stats.filename:
+            run_stats.save()
+            messages.append("Stats saved to " + run_stats.filename)
+    return messages
+
+
+# Upper limits of the bins of the histogram of the time to read each file, in seconds. Slower files go to a last bin
+latency_bins = [0.0001, 0.001, 0.01, 0.1, 1, 10]
+
+
+# Time spent in each stage of a run, recorded with the 'stats' setting, as well as the time and the bytes read of each file.
+# The stages are exclusive, so the time of a stage inside another one is only counted once: 'list' the folders, 'open' the files, 'read' them, 'search' the lines, 'extract' the values of the lines, and 'write' the CSV file.
+# 'filename' is the JSON file where the stats are saved, or True to save them next to the 'out' file
+class Stats:
+
+    def __init__(self, filename=False, out=''):
+        if filename is True:
+            filename = os.path.splitext(out)[0] + '_stats.json'
+        self.filename = filename
+        # Cumulative seconds of each stage
+        self.stages = collections.Counter()
+        self.bytes = 0
+        # (seconds, bytes) of each file read
+        self.files = []
+        # Seconds spent in the stages inside each of the running stages, which are not counted for them
+        self.nested = []
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        time_start = time.perf_counter()
+        self.nested.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - time_start
+            self.stages[name] += elapsed - self.nested.pop()
+            if self.nested:
+                self.nested[-1] += elapsed
+
+    # Add the (stages, bytes) of a file returned by measured_reader()
+    def add_file(self, record):
+        stages, read = record
+        self.stages.update(stages)
+        self.files.append((sum(stages.values()), read))
+
+    # Number of files read in each bin of 'latency_bins'
+    def histogram(self):
+        counts = [0] * (len(latency_bins) + 1)
+        for seconds, read in self.files:
+            counts[sum(seconds > limit for limit in latency_bins)] += 1
+        return counts
+
+    # Time to read the files at a fraction of the sorted list, such as 0.5 for the median
+    def percentile(self, fraction):
+        latencies = sorted(seconds for seconds, read in self.files)
+        return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+    # Lines of the summary printed at the end of main()
+    def summary(self):
+        total = sum(self.stages.values()) or 1
+        read = sum(read for seconds, read in self.files)
+        lines = ["Stats: " + str(len(self.files)) + " files read, " + "{:.2f}".format(read / 1e6) + " MB in total"]
+        lines.append("    {:<8}  {:>10}  {:>6}".format('stage', 'time [s]', 'share'))
+        for name in ['list', 'open', 'read', 'search', 'extract', 'write']:
+            lines.append("    {:<8}  {:>10.4f}  {:>5.1f}%".format(name, self.stages[name], 100 * self.stages[name] / total))
+        io = self.stages['list'] + self.stages['open'] + self.stages['read']
+        lines.append("    I/O {:.1f}%, CPU {:.1f}%".format(100 * io / total, 100 * (1 - io / total)))
+        if self.files:
+            lines.append("    Per file: {:.0f} bytes read on average, time p50 {:.2f} ms, p90 {:.2f} ms, p99 {:.2f} ms, max {:.2f} ms".format(read / len(self.files), 1000 * self.percentile(0.5), 1000 * self.percentile(0.9), 1000 * self.percentile(0.99), 1000 * max(seconds for seconds, read in self.files)))
+            limits = [''] + ["{:g} ms".format(1000 * limit) if limit < 1 else "{:g} s".format(limit) for limit in latency_bins] + ['']
+            for i, count in enumerate(self.histogram()):
+                label = (limits[i] + ' - ' + limits[i + 1]) if limits[i] and limits[i + 1] else ('< ' + limits[i + 1] if limits[i + 1] else '> ' + limits[i])
+                lines.append("    {:>16}  {:>8}  {}".format(label, count, '■' * round(50 * count / len(self.files))))
+        return lines
+
+    # Save the stats to the JSON file
+    def save(self):
+        with open(self.filename, 'w') as f:
+            json.dump({'stages': dict(self.stages), 'files': len(self.files), 'bytes': sum(read for seconds, read in self.files), 'latency_bins': latency_bins, 'histogram': self.histogram(), 'latencies': [seconds for seconds, read in self.files], 'bytes_per_file': [read for seconds, read in self.files]}, f, indent=1)
+
+
+# Stats of the file being read by this process, while measured_reader() is running
+instruments = None
+
+
+# Record the time of a stage in the 'stats', if they are not None
+def measure(stats, name):
+    if stats is None:
+        return contextlib.nullcontext()
+    return stats.stage(name)
+
+
+# Add the bytes read to the stats of the file being read
+def count_bytes(size):
+    if instruments is not None:
+        instruments.bytes += size
+
+
+# Call reader(directory), recording the time of its stages. The time not spent opening, reading or searching the file is counted as 'extract', and the time waiting for its prefetch, if any, as 'read'.
+# Returns the result of the reader and the (stages, bytes) of the file, to be added to the stats of the run, which may be in another process
+def measured_reader(reader, directory):
+    global instruments, prefetch_wait
+    instruments = Stats()
+    instruments.stages['read'] += prefetch_wait
+    prefetch_wait = 0.0
+    try:
+        with instruments.stage('extract'):
+            result = reader(directory)
+        return result, (dict(instruments.stages), instruments.bytes)
+    finally:
+        instruments = None
+
+
+# Yield the results of measured_reader(), adding their stages to the 'stats', or the results as they are if there are no stats
+def measured_results(results, stats):
+    if stats is None:
+        yield from results
+        return
+    for result, record in results:
+        stats.add_file(record)
+        yield result
+
+
+# This class will write rows to a CSV file as they come, in the same format as pandas did: missing values are left empty and short rows are filled up to 'width' columns.
+# The rows are flushed to disk every 'flush_interval' rows, so that they are not lost if the program stops
+class StreamWriter:
+
+    def __init__(self, filename, width, flush_interval=100, mode='w'):
+        self.file = open(filename, mode, newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file, lineterminator=os.linesep)
+        self.width = width
+        self.flush_interval = max(flush_interval, 1)
+        self.count = 0
+
+    def write(self, row):
+        # 'value != value' is only True for NaN
+        self.writer.writerow(['' if value is None or value != value else value for value in row] + [''] * (self.width - len(row)))
+        self.count += 1
+        if self.count % self.flush_interval == 0:
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+# Values of a row as they are written in the CSV file, to compare them with the rows read from a previous output
+def csv_strings(row, width):
+    if row is None:
+        return None
+    row = ['' if value is None else str(value) for value in row]
+    return row + [''] * (width - len(row))
+
+
+# This function will load the state saved by the previous run in incremental mode, returning a dict as {directory: {'stat', 'row', 'errors'}} with the rows read from the 'out' CSV file.
+# An empty dict is returned if there is no previous run, or if it does not match the current header and fields
+def load_state(out, header, fields):
+    try:
+        with open(out + '.state', 'r') as f:
+            state = json.load(f)
+        with open(out, 'r', newline='', encoding='utf-8') as f:
+            rows = list(csv.reader(f))
+    except (OSError, ValueError):
+        return {}
+    if state['fields'] != fields or not rows or rows[0] != csv_strings(header, len(header)):
+        return {}
+    rows = iter(rows[1:])
+    previous = {}
+    try:
+        for directory, file_stat, has_row, errors in state['directories']:
+            row = next(rows) if has_row else None
+            previous[directory] = {'stat': file_stat, 'row': row, 'errors': errors}
+    except StopIteration:
+        return {}
+    # The output was modified since the last run
+    if next(rows, None) is not None:
+        return {}
+    return previous
+
+
+# This function will save the state of an incremental run next to the 'out' CSV file, with the size and modification time of the file of each directory
+def save_state(out, header, fields, state):
+    with open(out + '.state', 'w') as f:
+        json.dump({'fields': fields, 'header': header, 'directories': state}, f)
 
 
 # This function will print a progress bar in the console, as well as the ETA, just for fun
 def progressbar(current, total, start=False):
+    # Jobs run by schedule_jobs() send their progress to the scheduler, only when the percentage changes
+    if progress_queue is not None:
+        if current == total or int(100 * current / total) != int(100 * (current - 1) / total):
+            progress_queue.put((progress_job, current, total, start is True))
+        return
     bar_length = 50
     percentage = int((current/total)*100)
     progress = int((bar_length*current)/total)
@@ -151,12 +922,14 @@ def progressbar(current, total, start=False):
         print(loadbar, end='\r')
 
 
-# This function will read the input file and execute the batch jobs
-def jobs(job_file):
+# This function will read the input file and execute the batch jobs.
+# Jobs that read the same files with exactly the same settings are run only once, and their output is copied. Jobs with different settings, such as other 'fields' or 'tags', read the files again. With max_workers > 1, independent jobs run at the same time, with at most 'max_workers' processes reading files in total
+def jobs(job_file, max_workers=1):
     current_directory = os.getcwd()
     job_file_path = os.path.join(current_directory, job_file)
     if os.path.isfile(job_file_path):
         is_file_empty = True
+        job_list = []
         with open(job_file, 'r') as f:
             lines = f.readlines()
         for line in lines[0:]:
@@ -164,26 +937,35 @@ def jobs(job_file):
             line = [x.strip() for x in line]
             if line[0].startswith('#') or line[0] == '':
                 continue
-            if (line[0] == 'cif' or line[0] == 'CIF' or line[0] == 'castep' or line[0] == 'CASTEP' or line[0] == 'phonon' or line[0] == 'PHONON') and (len(line) >= 3):
+            # Optional settings go at the end of the line, as 'key=value'
+            options = job_options(line)
+            if options is None:
+                error_job_option(line)
+                continue
+            job_line = line
+            line = [x for x in line if '=' not in x]
+            if (len(line) >= 3) and (line[0] == 'cif' or line[0] == 'CIF' or line[0] == 'castep' or line[0] == 'CASTEP' or line[0] == 'phonon' or line[0] == 'PHONON' or line[0] == 'folder' or line[0] == 'FOLDER'):
                 is_file_empty = False
+                # Patterns of folders and lists of files can not be part of the default names
+                name = re.sub(r'[\\/*?\[\]\s]+', '_', line[2])
                 if len(line) <= 3:
-                    errors = 'errors_' + line[1] + '_' + line[2] + '.txt'
-                    out = 'out_' + line[1] + '_' + line[2] + '.csv'
+                    errors = 'errors_' + line[1] + '_' + name + '.txt'
+                    out = 'out_' + line[1] + '_' + name + '.csv'
                 else:
                     out = line[3]
                     if len(line) <= 4:
-                        errors = 'errors_' + line[1] + '_' + line[2] + '.txt'
+                        errors = 'errors_' + line[1] + '_' + name + '.txt'
                     else:
                         errors = line[4]
                 data_folder = line[1]
                 data_path = os.path.join(current_directory, data_folder)
+                # Some settings are only valid for some of the formats
+                reader = reader_module(line[0].lower())
+                if not accepts_options(reader.main, options):
+                    error_job_option(job_line)
+                    continue
                 if os.path.isdir(data_path):
-                    if line[0] == 'cif' or line[0] == 'CIF':
-                        cif.main(line[1], line[2], out, errors)
-                    if line[0] == 'castep' or line[0] == 'CASTEP':
-                        castep.main(line[1], line[2], out, errors)
-                    if line[0] == 'phonon' or line[0] == 'PHONON':
-                        phonon.main(line[1], line[2], out, errors)
+                    job_list.append({'mode': line[0].lower(), 'arguments': [line[1], line[2], out, errors], 'options': options, 'copies': []})
                 else:
                     error_datafolder_missing(line)
                     continue
@@ -193,16 +975,288 @@ def jobs(job_file):
         if is_file_empty:
             error_jobfile_empty(job_file)
             exit()
+        job_list = merge_jobs(job_list)
+        if max_workers <= 1:
+            for job in job_list:
+                run_job(job)
+        else:
+            schedule_jobs(job_list, max_workers)
     else:
         error_jobfile_missing(job_file)
         exit()
 
 
+# Scripts that read each format of the jobs. They are only imported when a job needs them, to start faster
+reader_modules = {'castep': 'cr_castep', 'cif': 'cr_cif', 'phonon': 'cr_phonon', 'folder': 'cr_folder'}
+
+
+def reader_module(mode):
+    return importlib.import_module(reader_modules[mode])
+
+
+# Import numpy only when it is needed, since it takes a while. Returns None if it is not installed
+def numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+# Merge the jobs that read the same files with the same settings, and only differ in their output and error files, which are added to the 'copies' of the first one.
+# Only exact duplicates are merged: jobs reading the same files with different settings, such as other 'fields' or 'tags', are kept apart and read the files again
+def merge_jobs(job_list):
+    merged = {}
+    for job in job_list:
+        key = repr([job['mode'], job['arguments'][0:2], sorted(job['options'].items())])
+        if key in merged:
+            merged[key]['copies'].append(job['arguments'][2:4])
+        else:
+            merged[key] = job
+    return list(merged.values())
+
+
+# Number of functions listed in the console when a job is run with 'profile'
+profile_lines = 20
+
+
+# Files written next to the output by the settings of a job given as 'yes', as the suffixes added to the name of the output, without its extension
+side_file_suffixes = {'spectra': ['_spectra.npz', '_spectra_errors.txt'], 'index': ['_index.json'], 'stats': ['_stats.json'], 'trajectory': ['_trajectory.npz', '_trajectory_errors.txt'], 'profile': ['.prof']}
+
+
+# Files of a job next to its output 'out': the state of the incremental mode, and the files of the settings given as 'yes', with their default names
+def side_files(out, options):
+    files = [out + '.state']
+    for key, suffixes in side_file_suffixes.items():
+        if options.get(key) is True:
+            files.extend(os.path.splitext(out)[0] + suffix for suffix in suffixes)
+    return files
+
+
+# Run a job, and copy its output, error and side files to the merged jobs, so that each copy gets the files it would have written on its own
+def run_job(job):
+    reader = reader_module(job['mode'])
+    options = dict(job['options'])
+    profile = options.pop('profile', False)
+    if profile:
+        profile_job(reader.main, job['arguments'], options, profile)
+    else:
+        reader.main(*job['arguments'], **options)
+    out, out_error = job['arguments'][2:4]
+    for copy_out, copy_error in job['copies']:
+        for source, destination in [(out, copy_out), (out_error, copy_error)] + list(zip(side_files(out, job['options']), side_files(copy_out, job['options']))):
+            if os.path.isfile(source) and os.path.abspath(source) != os.path.abspath(destination):
+                shutil.copyfile(source, destination)
+        print("  Output also copied to ", copy_out)
+        print("")
+
+
+# Run the main() function of a job with cProfile, saving the profile to the 'profile' file, or next to the output as Output.prof if profile is True, and listing the slowest functions.
+# Only the main process is profiled, so with workers > 1 the time spent reading the files is seen as waiting for the workers
+def profile_job(function, arguments, options, profile):
+    import cProfile
+    import pstats
+    if profile is True:
+        profile = os.path.splitext(arguments[2])[0] + '.prof'
+    profiler = cProfile.Profile()
+    profiler.runcall(function, *arguments, **options)
+    profiler.dump_stats(profile)
+    print("  Profile saved to ", profile)
+    print("  Slowest functions, by cumulative time:")
+    pstats.Stats(profiler, stream=sys.stdout).sort_stats('cumulative').print_stats(profile_lines)
+
+
+# Progress of a job run by schedule_jobs() in another process, which progressbar() sends to the scheduler through this queue instead of printing it
+progress_queue = None
+progress_job = None
+
+
+# Run a job in its own process for schedule_jobs(). Its console output is saved to the 'log' file, and the progress is sent through the 'progress' queue as (number, current, total, errors), with current = None when it finishes
+def run_job_process(job, number, progress, log):
+    global progress_queue, progress_job
+    progress_queue = progress
+    progress_job = number
+    with open(log, 'w', encoding='utf-8') as f, contextlib.redirect_stdout(f):
+        try:
+            run_job(job)
+        except BaseException:
+            traceback.print_exc(file=f)
+    progress.put((number, None, None, None))
+
+
+# Files written by a job, or shared with other jobs, so that jobs using the same files do not run at the same time
+def job_files(job):
+    files = [job['arguments'][2], job['arguments'][3]] + side_files(job['arguments'][2], job['options'])
+    for copy in job['copies']:
+        files.extend(copy)
+        files.extend(side_files(copy[0], job['options']))
+    for key in ['cache', 'index', 'spectra', 'trajectory', 'stats', 'profile']:
+        if isinstance(job['options'].get(key), str):
+            files.append(job['options'][key])
+    return set(os.path.abspath(file) for file in files)
+
+
+# Run the jobs at the same time in separate processes, as long as the sum of their workers does not exceed 'max_workers', and they do not use the same files as a previous job that did not finish yet.
+# The output of each job is printed when it finishes, and a single bar shows the progress of all of them meanwhile
+def schedule_jobs(job_list, max_workers):
+    import multiprocessing
+    import tempfile
+    for job in job_list:
+        job['options']['workers'] = max(1, min(job['options'].get('workers', 1), max_workers))
+    progress = multiprocessing.Queue()
+    pending = list(range(len(job_list)))
+    running = {}
+    done = 0
+    status = {}
+    log_directory = tempfile.mkdtemp(prefix='CrystalReader_')
+    time_start = time.time()
+    try:
+        while pending or running:
+            # Start the pending jobs, in order, while there are workers left
+            busy = sum(job_list[number]['options']['workers'] for number in running)
+            for number in list(pending):
+                job = job_list[number]
+                earlier = [other for other in pending + list(running) if other < number]
+                if any(job_files(job) & job_files(job_list[other]) for other in earlier):
+                    continue
+                if running and busy + job['options']['workers'] > max_workers:
+                    continue
+                log = os.path.join(log_directory, str(number) + '.log')
+                process = multiprocessing.Process(target=run_job_process, args=(job, number, progress, log))
+                process.start()
+                running[number] = (process, log)
+                pending.remove(number)
+                status[number] = (0, 1, False)
+                busy += job['options']['workers']
+            # Wait for news from the running jobs
+            finished = []
+            try:
+                message = progress.get(timeout=0.5)
+                while True:
+                    number, current, total, errors = message
+                    if current is None:
+                        finished.append(number)
+                    else:
+                        status[number] = (current, total, errors)
+                    message = progress.get_nowait()
+            except queue.Empty:
+                pass
+            # Jobs that stopped without saying it, for example if they were killed
+            finished.extend(number for number, (process, log) in running.items() if not process.is_alive() and number not in finished)
+            for number in finished:
+                if number not in running:
+                    continue
+                process, log = running.pop(number)
+                process.join()
+                done += 1
+                status[number] = (1, 1, status[number][2])
+                print(" " * 100, end='\r')
+                print("")
+                print("  Job " + str(number + 1) + " of " + str(len(job_list)) + ": " + ", ".join([job_list[number]['mode']] + job_list[number]['arguments']))
+                with open(log, 'r', encoding='utf-8') as f:
+                    print(f.read(), end='')
+            jobs_progressbar(status, done, len(job_list), running, time_start)
+    finally:
+        shutil.rmtree(log_directory, ignore_errors=True)
+    print("")
+
+
+# A single progress bar for all the jobs of schedule_jobs(), as the mean progress of the jobs that started, and the number of jobs finished and running
+def jobs_progressbar(status, done, total, running, time_start):
+    bar_length = 50
+    fraction = sum(current / total_files for current, total_files, errors in status.values()) / total if total else 1
+    progress = int(bar_length * fraction)
+    loadbar = "  [{:{len}}]{:4.0f}%    {} of {} jobs done, {} running".format(progress*'■', fraction*100, done, total, len(running), len=bar_length)
+    if any(errors for current, total_files, errors in status.values()):
+        loadbar += ", errors detected..."
+    print(loadbar + "  ", end='\r')
+
+
+# This function will read the optional 'key=value' settings of a job line, returning them as a dict, or None if any of them is not valid
+def job_options(line):
+    options = {}
+    for item in line:
+        if '=' not in item:
+            continue
+        key, value = [x.strip() for x in item.split('=', 1)]
+        if key not in job_settings:
+            return None
+        try:
+            options[key] = job_settings[key](value)
+        except ValueError:
+            return None
+    return options
+
+
+# Check that a main() function has arguments for all the settings of a job, except for the ones used by run_job()
+def accepts_options(function, options):
+    arguments = function.__code__.co_varnames[:function.__code__.co_argcount]
+    return all(key in arguments or key in job_level_settings for key in options)
+
+
+# Number of processes to read the files, or 'auto' to use all the CPUs
+def read_workers(value):
+    if value == 'auto':
+        return os.cpu_count()
+    return int(value)
+
+
+# Read yes/no settings
+def read_bool(value):
+    if value.lower() in ['yes', 'true', '1']:
+        return True
+    if value.lower() in ['no', 'false', '0']:
+        return False
+    raise ValueError(value)
+
+
+# Name of the cache file, 'yes' for the default one, or 'no' to disable it
+def read_cache(value):
+    if value.lower() in ['yes', 'true']:
+        return cr_cache.default_cache
+    if value.lower() in ['no', 'false', '']:
+        return False
+    return value
+
+
+# Name of an extra output file, 'yes' for the default one, next to the output of the job, or 'no' to disable it
+def read_output(value):
+    if value.lower() in ['yes', 'true']:
+        return True
+    if value.lower() in ['no', 'false', '']:
+        return False
+    return value
+
+
+# Settings that can be given in a job line, and the functions that read their values
+job_settings = {
+    'workers': read_workers,
+    'mmap_mode': read_bool,
+    'cache': read_cache,
+    'cache_clear': read_bool,
+    'incremental': read_bool,
+    'flush_interval': int,
+    'spectra': read_output,
+    'fields': str.split,
+    'tags': str.split,
+    'budget': float,
+    'trajectory': read_output,
+    'prefetch': int,
+    'index': read_output,
+    'stats': read_output,
+    'profile': read_output,
+}
+# Settings used by run_job() instead of the main() function of the format
+job_level_settings = ['profile']
+
+
 # Take the list of missing files as errors and slow loops as warnings, write them to a log file and display in the console
 def errorlog(error_log, errors):
     if len(errors) > 0:
-        log = pd.DataFrame(errors)
-        log.to_csv(error_log, header=False, index=False)
+        log = StreamWriter(error_log, max(len(error) for error in errors), len(errors))
+        for error in errors:
+            log.write(error)
+        log.close()
         print("  ------------------------------------------------------------")
         print("  COMPLETED WITH ERRORS:")
         for k in errors:
@@ -231,6 +1285,17 @@ def error_job_unknown(line):
     print("")
 
 
+def error_job_option(line):
+    print("")
+    print("  ------------------------------------------------------------")
+    print("  ERROR:  Unknown or wrong setting. Check this line:")
+    print(' ',line)
+    print("  Valid settings are:", ', '.join(job_settings))
+    print("  Skipping to the next job...")
+    print("  ------------------------------------------------------------")
+    print("")
+
+
 def error_jobfile_empty(job_file):
     print("")
     print("  ------------------------------------------------------------")
@@ -250,11 +1315,31 @@ def error_jobfile_missing(job_file):
         f.write("# This is free software, and you are welcome to redistribute it under GNU General Public License\n")
         f.write("#\n")
         f.write("# Write here all the CrystalReader jobs that you want to execute, following this format:\n")
-        f.write("# Format(=castep/cif/phonon), DataFolder, DataFiles\n")
+        f.write("# Format(=castep/cif/phonon/folder), DataFolder, DataFiles\n")
         f.write("# Additionally, you can also specify the desired names for the output file and the error log:\n")
         f.write("# Format, DataFolder, DataFiles, Output, ErrorLog\n")
         f.write("# If you specify subpaths, make sure that said folders ('data' and 'out' here) already exist:\n")
         f.write("# Format, data\DataFolder, DataFiles, out\Output, out\ErrorLog\n")
+        f.write("# Optional settings can be added at the end of the line as key=value, such as the number of processes to read the files in parallel:\n")
+        f.write("# Format, DataFolder, DataFiles, workers=8\n")
+        f.write("# Big files can be memory-mapped, which is usually faster, with mmap_mode=yes\n")
+        f.write("# To skip the files that did not change since the last run, use cache=yes, or cache=filename.sqlite. Add cache_clear=yes to forget the cached files of a DataFolder:\n")
+        f.write("# Format, DataFolder, DataFiles, cache=yes\n")
+        f.write("# With incremental=yes, only the new or modified files are read, and the rest of the rows are kept from the previous Output:\n")
+        f.write("# Format, DataFolder, DataFiles, incremental=yes\n")
+        f.write("# The rows are saved as they are read, and flushed to disk every 100 rows by default, which can be changed with flush_interval=N\n")
+        f.write("# The data files can also be given as a pattern of folders, such as */*/cc-2.castep or **/cc-2.castep for any depth,\n")
+        f.write("# and the folders found can be saved with index=yes, to be reused while the folders do not change\n")
+        f.write("# On network filesystems, prefetch=N reads ahead the end of the next N files with N threads, when workers=1\n")
+        f.write("# To see where the time goes, stats=yes prints the time of each stage and saves it to Output_stats.json, or to stats=filename.json,\n")
+        f.write("# and profile=yes profiles the job with cProfile, saving it to Output.prof, or to profile=filename.prof\n")
+        f.write("# For castep jobs, the columns to extract can be chosen with fields=energy space_group a b c\n")
+        f.write("# and the values of every LBFGS iteration can be saved to a NumPy file with trajectory=yes or trajectory=filename.npz\n")
+        f.write("# Each file is given up after the 'cry' seconds set in the script of its format, and budget=N gives N seconds to the whole job; the files not read in time are reported as timed out\n")
+        f.write("# For cif jobs, any tags can be read instead of the default columns with tags=_cell_length_a _cell_volume _atom_site_label\n")
+        f.write("# The castep, cif and phonon files of each folder can be read in a single pass, into a single Output joined by filename, with:\n")
+        f.write("# folder, DataFolder, DataFile.castep DataFile.cif DataFile.phonon, Output, ErrorLog\n")
+        f.write("# For phonon jobs, all the frequencies and IR intensities of all the q-points can be saved to Output_spectra.npz with spectra=yes, or to spectra=filename.npz\n")
         f.write("#\n")
         f.write("# Example:\n")
         f.write("# phonon, data_rscan, rscan.phonon, out.csv, errors.txt\n")
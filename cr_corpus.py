@@ -0,0 +1,243 @@
+"""
+CrystalReader Corpus. Write synthetic castep, cif and phonon files, to try and benchmark CrystalReader.
+Copyright (C) 2023  Pablo Gila-Herranz
+If you find this code useful, a citation would be awesome :D
+Pablo Gila-Herranz, “CrystalReader”, 2023. https://github.com/pablogila/CrystalReader
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import os
+import sys
+import random
+
+
+##################################################################
+#                PARAMETERS THAT YOU MAY MODIFY
+##################################################################
+# Number of folders of the corpus, each one with a castep, a cif and a phonon file
+corpus_folders = 200
+# Names of the files inside each folder, as in the default jobs
+data_castep = 'cc-2.castep'
+data_cif = 'cc-2-out.cif'
+data_phonon = 'cc-2_Efield.phonon'
+# Approximate size of each .castep file, in bytes. More LBFGS iterations are written to reach it
+castep_size = 200000
+# Number of vibration modes and q-points of each .phonon file
+phonon_modes = 144
+phonon_qpts = 2
+# Number of atoms of each .cif file
+cif_atoms = 48
+# Fraction of the files that are missing, corrupted with values that are not numbers, or truncated at a random point, as unfinished calculations
+missing = 0.02
+corrupted = 0.05
+truncated = 0.05
+# Seed of the random numbers, so that the same corpus is written every time
+seed = 0
+##################################################################
+# Usage, from the command line:
+# python cr_corpus.py [data_folder] [folders]
+
+
+# Space groups written to the files, as (number, Hermann-Mauguin symbol, Hall symbol)
+space_groups = [(62, 'Pnma', '-P 2ac 2n'), (14, 'P21/c', '-P 2ybc'), (2, 'P-1', '-P 1'), (225, 'Fm-3m', '-F 4 2 3'), (194, 'P63/mmc', '-P 6c 2c')]
+
+
+# Random cell of a structure, as the lengths (a, b, c) and angles (alpha, beta, gamma)
+def random_cell(rng):
+    return [rng.uniform(3, 12) for i in range(3)] + [rng.choice([90.0, 90.0, rng.uniform(60, 120)]) for i in range(2)] + [rng.choice([90.0, 120.0])]
+
+
+# Lines of the 'Unit Cell' block of a .castep file, with the volume and density
+def castep_cell(cell):
+    a, b, c, alpha, beta, gamma = cell
+    lines = []
+    lines.append("                           -------------------------------")
+    lines.append("                                      Unit Cell")
+    lines.append("                           -------------------------------")
+    lines.append("        Real Lattice(A)              Reciprocal Lattice(1/A)")
+    lines.append("   {:14.7f}{:14.7f}{:14.7f}     {:12.7f}{:12.7f}{:12.7f}".format(a, 0, 0, 6.2831853 / a, 0, 0))
+    lines.append("   {:14.7f}{:14.7f}{:14.7f}     {:12.7f}{:12.7f}{:12.7f}".format(0, b, 0, 0, 6.2831853 / b, 0))
+    lines.append("   {:14.7f}{:14.7f}{:14.7f}     {:12.7f}{:12.7f}{:12.7f}".format(0, 0, c, 0, 0, 6.2831853 / c))
+    lines.append("")
+    lines.append("                       Lattice parameters(A)       Cell Angles")
+    lines.append("                    a =     {:10.6f}          alpha =  {:10.6f}".format(a, alpha))
+    lines.append("                    b =     {:10.6f}          beta  =  {:10.6f}".format(b, beta))
+    lines.append("                    c =     {:10.6f}          gamma =  {:10.6f}".format(c, gamma))
+    lines.append("")
+    lines.append("                       Current cell volume =         {:12.6f}       A**3".format(a * b * c))
+    lines.append("                                   density =         {:12.6f}   AMU/A**3".format(300 / (a * b * c)))
+    lines.append("                                           =         {:12.6f}     g/cm^3".format(498.17 / (a * b * c)))
+    lines.append("")
+    return lines
+
+
+# Text of a .castep file of approximately 'size' bytes: a header with the space group, LBFGS iterations with their SCF cycles and cells, and the final results
+def castep_text(rng, size):
+    cell = random_cell(rng)
+    number, symbol, hall = rng.choice(space_groups)
+    energy = rng.uniform(-20000, -1000)
+    lines = []
+    lines.append(" +-------------------------------------------------+")
+    lines.append(" |                                                 |")
+    lines.append(" |      CCC   AA    SSS  TTTTT  EEEEE  PPPP        |")
+    lines.append(" |     C     A  A  S       T    E      P   P       |")
+    lines.append(" |     C     AAAA   SS     T    EEE    PPPP        |")
+    lines.append(" |     C     A  A     S    T    E      P           |")
+    lines.append(" |      CCC  A  A  SSS     T    EEEEE  P           |")
+    lines.append(" |                                                 |")
+    lines.append(" +-------------------------------------------------+")
+    lines.append("")
+    lines.append(" ************************************ Title ************************************")
+    lines.append(" Synthetic calculation written by cr_corpus.py")
+    lines.append("")
+    lines.extend(castep_cell(cell))
+    lines.append(" Space group of crystal = {:3d}: {}, {}".format(number, symbol, hall))
+    lines.append("")
+    text = "\n".join(lines) + "\n"
+    iterations = []
+    written = len(text)
+    iteration = 0
+    while written < size or iteration == 0:
+        iteration += 1
+        energy += rng.uniform(-0.01, 0)
+        cell = [value * rng.uniform(0.999, 1.001) for value in cell[:3]] + cell[3:]
+        lines = []
+        lines.append(" ================================================================================")
+        lines.append(" Starting LBFGS iteration          {} ... with trial guess (lambda=  1.000000)".format(iteration))
+        lines.append(" ================================================================================")
+        lines.append("")
+        lines.extend(castep_cell(cell))
+        for scf in range(1, rng.randint(8, 30)):
+            lines.append("      {:4d}  {:16.8E}   {:16.8E}   {:16.8E}       {:6d}.00   <-- SCF".format(scf, energy + rng.uniform(0, 1) / scf, 0.0, rng.uniform(0, 1) / scf ** 2, scf * 7))
+        lines.append("")
+        lines.append(" Final energy, E             =  {:.9f}     eV".format(energy))
+        lines.append(" Final free energy (E-TS)    =  {:.9f}     eV".format(energy))
+        lines.append(" Total energy corrected for finite basis set =  {:.9f}     eV".format(energy - 0.1))
+        lines.append("")
+        lines.append(" LBFGS: finished iteration     {} with enthalpy= {:.8E} eV".format(iteration, energy))
+        lines.append("")
+        chunk = "\n".join(lines) + "\n"
+        iterations.append(chunk)
+        written += len(chunk)
+    lines = []
+    lines.append(" LBFGS: Final Enthalpy     = {:.8E} eV".format(energy))
+    lines.append(" LBFGS: Final <frequency>  =     1234.56789 cm-1")
+    lines.append(" LBFGS: Final bulk modulus =     123.45678 GPa")
+    lines.append("")
+    lines.append(" Total time          =     {:10.2f} s".format(rng.uniform(100, 100000)))
+    lines.append("")
+    return text + "".join(iterations) + "\n".join(lines) + "\n"
+
+
+# Text of a .cif file, with the cell, the space group, the symmetry operations and a loop of 'atoms' sites
+def cif_text(rng, atoms):
+    a, b, c, alpha, beta, gamma = random_cell(rng)
+    number, symbol, hall = rng.choice(space_groups)
+    lines = []
+    lines.append("data_synthetic")
+    lines.append("_audit_creation_method 'cr_corpus.py'")
+    lines.append("_chemical_name_common 'synthetic structure'")
+    lines.append("_cell_length_a {:.6f}".format(a))
+    lines.append("_cell_length_b {:.6f}".format(b))
+    lines.append("_cell_length_c {:.6f}".format(c))
+    lines.append("_cell_angle_alpha {:.6f}".format(alpha))
+    lines.append("_cell_angle_beta {:.6f}".format(beta))
+    lines.append("_cell_angle_gamma {:.6f}".format(gamma))
+    lines.append("_cell_volume {:.6f}".format(a * b * c))
+    # Some programs write the H_M variant of the tag
+    tag = rng.choice(['_symmetry_space_group_name_H-M', '_symmetry_space_group_name_H-M', '_symmetry_space_group_name_H_M'])
+    lines.append("{}   '{}'".format(tag, symbol))
+    lines.append("_symmetry_Int_Tables_number {}".format(number))
+    lines.append("")
+    lines.append("loop_")
+    lines.append("_symmetry_equiv_pos_as_xyz")
+    for operation in ['x, y, z', '-x, -y, -z', '-x+1/2, y+1/2, -z+1/2', 'x+1/2, -y+1/2, z+1/2']:
+        lines.append("  '" + operation + "'")
+    lines.append("")
+    lines.append("loop_")
+    for column in ['label', 'type_symbol', 'fract_x', 'fract_y', 'fract_z', 'U_iso_or_equiv', 'occupancy']:
+        lines.append("_atom_site_" + column)
+    for i in range(atoms):
+        element = rng.choice(['C', 'H', 'N', 'O', 'Si'])
+        lines.append("{}{} {} {:.5f} {:.5f} {:.5f} {:.4f} 1.0".format(element, i + 1, element, rng.random(), rng.random(), rng.random(), rng.uniform(0.005, 0.05)))
+    lines.append("")
+    return "\n".join(lines) + "\n"
+
+
+# Text of a .phonon file, with 'qpts' blocks of the frequencies and IR intensities of 'modes' modes
+def phonon_text(rng, modes, qpts):
+    lines = []
+    lines.append(" BEGIN header")
+    lines.append(" Number of ions        {}".format(max(1, modes // 3)))
+    lines.append(" Number of branches   {}".format(modes))
+    lines.append(" Number of wavevectors  {}".format(qpts))
+    lines.append(" Frequencies in         cm-1")
+    lines.append(" IR intensities in      (D/A)**2/amu")
+    lines.append(" END header")
+    frequencies = sorted(rng.uniform(0, 3500) for i in range(modes))
+    for q in range(1, qpts + 1):
+        lines.append("     q-pt=    {}   {:.6f}  {:.6f}  {:.6f}      {:.10f}".format(q, 0.0, 0.0, 0.5 * (q - 1) / qpts, 1.0 / qpts))
+        for k in range(modes):
+            # The first three modes are the acoustic ones, close to zero at the gamma point
+            frequency = rng.uniform(-0.05, 0.05) if k < 3 else frequencies[k] + rng.uniform(-1, 1)
+            lines.append("   {:7d}  {:14.6f}  {:14.7f}".format(k + 1, frequency, rng.random()))
+        lines.append("                        Phonon Eigenvectors")
+    return "\n".join(lines) + "\n"
+
+
+# Replace some of the numbers of a text with values that can not be read
+def corrupt(rng, text):
+    lines = text.split("\n")
+    for i in rng.sample(range(len(lines)), max(1, len(lines) // 10)):
+        lines[i] = lines[i].replace('.', '*', 1).replace('=', '= ***', 1)
+    return "\n".join(lines)
+
+
+# Write a file of the corpus, which may be left missing, corrupted or truncated. Returns the kind of file written: 'ok', 'missing', 'corrupted' or 'truncated'
+def write_file(rng, filename, text):
+    kind = rng.choices(['missing', 'corrupted', 'truncated', 'ok'], [missing, corrupted, truncated, 1 - missing - corrupted - truncated])[0]
+    if kind == 'missing':
+        return kind
+    if kind == 'corrupted':
+        text = corrupt(rng, text)
+    if kind == 'truncated':
+        text = text[:int(len(text) * rng.uniform(0.3, 0.95))]
+    with open(filename, 'w') as f:
+        f.write(text)
+    return kind
+
+
+# Write a corpus of 'folders' folders inside 'path', each one with a castep, a cif and a phonon file. Returns a dict with the number of files of each kind, as {data_file: {kind: count}}
+def write_corpus(path, folders=corpus_folders):
+    rng = random.Random(seed)
+    kinds = {data_file: {'ok': 0, 'missing': 0, 'corrupted': 0, 'truncated': 0} for data_file in [data_castep, data_cif, data_phonon]}
+    for i in range(folders):
+        directory = os.path.join(path, 'struct-' + str(i).zfill(6))
+        os.makedirs(directory, exist_ok=True)
+        for data_file, text in [(data_castep, castep_text(rng, castep_size)), (data_cif, cif_text(rng, cif_atoms)), (data_phonon, phonon_text(rng, phonon_modes, phonon_qpts))]:
+            kinds[data_file][write_file(rng, os.path.join(directory, data_file), text)] += 1
+    return kinds
+
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else 'data_corpus'
+    folders = int(sys.argv[2]) if len(sys.argv) > 2 else corpus_folders
+    kinds = write_corpus(path, folders)
+    print("")
+    print("  Corpus of", folders, "folders written to ", path)
+    for data_file, counts in kinds.items():
+        print("  {:<20} ".format(data_file) + ", ".join(str(count) + " " + kind for kind, count in counts.items()))
+    print("")
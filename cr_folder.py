@@ -0,0 +1,197 @@
+"""
+CrystalReader 'folder' script. Read the '.castep', '.cif' and '.phonon' files of each folder in a single pass, into a joined table.
+Copyright (C) 2023  Pablo Gila-Herranz
+If you find this code useful, a citation would be awesome :D
+Pablo Gila-Herranz, “CrystalReader”, 2023. https://github.com/pablogila/CrystalReader
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import os
+import time
+import functools
+import cr_common as cr
+import cr_table
+import cr_castep as castep
+import cr_cif as cif
+import cr_phonon as phonon
+
+
+##################################################################
+#                PARAMETERS THAT YOU MAY MODIFY
+##################################################################
+# The columns of each format are set in their own scripts, as well as their 'cry', 'tail_window' and 'safemode' parameters. The castep fields can also be chosen with the 'fields' argument
+# Run the main script for folder jobs at execution. Set to False to import the functions as a module.
+run_at_import = False
+# Rename the file_name in the xxx-xxx-xxx-xxx format, set to False to keep the original name
+rename_files = False
+# Main program for reading the castep, cif and phonon files of each folder. 'data_files' is a list with the names of the files, or a string with the names separated by spaces; the format of each one is given by its extension. With 'table=True', the rows are also kept in memory as a cr_table.Table, which is returned. A 'budget' of seconds can be given for the whole job, as in cr.main_setup()
+def main(data_directory='data', data_files='cc-2.castep cc-2-out.cif cc-2_Efield.phonon', out='out_folder.csv', out_error='errors_folder.txt', workers=1, mmap_mode=False, flush_interval=100, index=False, stats=False, fields=None, table=False, budget=False):
+##################################################################
+
+    print("")
+    if run_at_import == False:
+        print("  Running CrystalReader in 'folder' mode...")
+    if run_at_import == True:
+        print("  Running CrystalReader", cr.version(), "in 'folder' mode...")
+        print("  If you find this code useful, a citation would be awesome :D")
+        print("  Gila-Herranz, Pablo. “CrystalReader”, 2023. https://github.com/pablogila/CrystalReader")
+    print("")
+    print("  data directory:      ", data_directory)
+    print("  data files:          ", data_files)
+    print("  output file:         ", out)
+    print("  error log:           ", out_error)
+    print("  workers:             ", workers)
+    print("  mmap mode:           ", mmap_mode)
+    print("  flush interval:      ", flush_interval)
+    print("  index:               ", index)
+    print("  stats:               ", stats)
+    print("  budget:              ", budget)
+    print("")
+
+    if isinstance(data_files, str):
+        data_files = data_files.split()
+    if fields is None:
+        fields = castep.default_fields
+    # Format of each data file, from its extension
+    parts = []
+    for data_file in data_files:
+        mode = os.path.splitext(data_file)[1].lower().lstrip('.')
+        if mode not in formats:
+            error_unknown_format(data_file)
+            return
+        parts.append([mode, data_file, part_settings(mode, fields)])
+    unknown = [field for field in fields if field not in castep.castep_fields]
+    if unknown:
+        castep.error_unknown_fields(unknown)
+        return
+    if cr.numpy() is None and any(mode == 'phonon' for mode, data_file, settings in parts):
+        print("  ------------------------------------------------------------")
+        print("  ERROR:  Could not import the numpy module, needed to read")
+        print("  the .phonon files. Perform 'pip install --user numpy'")
+        print("  ------------------------------------------------------------")
+        print("")
+        return
+    header = joined_header(parts)
+
+    # The folders are only listed once, for all the files. The data files can also be patterns such as '*/*/cc-2.castep', with the same folders for all of them
+    path, directories, data_file, run_stats, job_deadline = cr.main_setup(data_directory, data_files[0], out, index, stats, budget)
+    for part in parts:
+        part[1] = os.path.basename(part[1])
+
+    # Start a timer, for the final message
+    time_start = time.time()
+
+    # The results are identified by the header and the settings, without the budget
+    settings = str([cr.version(), header, parts])
+    # All the files of the job share the same budget, also with workers
+    if job_deadline is not None:
+        for part in parts:
+            part[2]['budget'] = job_deadline
+    # Read the files in each folder of the /data path. The joined row of each folder is extracted by read_directory()
+    reader = functools.partial(read_directory, path=path, parts=parts, mmap_mode=mmap_mode)
+    rows = cr_table.Table(header, joined_types(parts)) if table else None
+    messages = cr.main_loop(reader, directories, path, data_file, header, out, out_error, settings, workers, flush_interval=flush_interval, run_stats=run_stats, table=rows)
+
+    # Final message
+    time_elapsed = round(time.time() - time_start, 1)
+    print("")
+    print("  Finished reading ", data_directory + "/.../" + " ".join(part[1] for part in parts), " files in " + str(time_elapsed) + " seconds")
+    print("  Data extracted and saved to ", out)
+    for message in messages:
+        print("  " + message)
+    print("")
+    return rows
+
+
+# Scripts that read each format
+formats = {'castep': castep, 'cif': cif, 'phonon': phonon}
+
+
+# Settings of the read_directory() function of each format, taken from its script
+def part_settings(mode, fields):
+    reader = formats[mode]
+    settings = {'safemode': reader.safemode, 'rename_files': rename_files, 'cry': reader.cry}
+    if mode == 'castep':
+        settings['window'] = cr.Window(reader.tail_window, reader.tail_step, reader.tail_cap)
+        settings['fields'] = fields
+    if mode == 'phonon':
+        settings['threshold'] = reader.threshold
+        settings['data_lines_phonon'] = reader.data_lines_phonon
+    return settings
+
+
+# Columns of a format, besides the filename
+def part_columns(mode, settings):
+    if mode == 'castep':
+        return castep.make_header(settings['fields'])[1:]
+    return formats[mode].header[1:]
+
+
+# Types of the columns of a format, besides the filename, for the tables of cr_table.py
+def part_types(mode, settings):
+    if mode == 'castep':
+        return castep.make_types(settings['fields'])[1:]
+    return formats[mode].types[1:]
+
+
+# Types of the columns of the joined table, in the same order as joined_header()
+def joined_types(parts):
+    types = ['text']
+    for mode, data_file, settings in parts:
+        types.extend(part_types(mode, settings))
+    return types
+
+
+# Header of the joined table: the filename, followed by the columns of each format. Columns with the same name in several formats get the name of the format in front
+def joined_header(parts):
+    header = ['filename']
+    for mode, data_file, settings in parts:
+        for column in part_columns(mode, settings):
+            header.append(mode + ' ' + column if column in header else column)
+    return header
+
+
+# Read all the data files of a single directory, with the read_directory() function of each format, returning the joined row and a list with the errors found.
+# The columns of the files that are missing, or discarded by the safemode, are left empty. The row is None only if all the files are missing
+def read_directory(directory, path, parts, mmap_mode=False):
+    file_name = None
+    values = []
+    errors = []
+    for mode, data_file, settings in parts:
+        width = len(part_columns(mode, settings))
+        part_row, part_errors = formats[mode].read_directory(directory, path, data_file, mmap_mode=mmap_mode, **settings)
+        # The errors say which file they come from
+        errors.extend(error + [data_file] for error in part_errors)
+        if part_row is None:
+            values.extend([None] * width)
+        else:
+            file_name = part_row[0]
+            values.extend((part_row[1:] + [None] * width)[:width])
+    if file_name is None:
+        return None, errors
+    return [file_name] + values, errors
+
+
+def error_unknown_format(data_file):
+    print("  ------------------------------------------------------------")
+    print("  ERROR:  Unknown format of the data file", data_file)
+    print("  The extension must be one of:", ", ".join('.' + mode for mode in formats))
+    print("  ------------------------------------------------------------")
+    print("")
+
+
+if run_at_import:
+    main()
@@ -21,8 +21,9 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import os
 import time
+import functools
 import cr_common as cr
-import pandas as pd
+import cr_table
 
 
 ##################################################################
@@ -35,6 +36,8 @@ data_lines_phonon = 144
 # !!! IF YOU CHANGE THE HEADER, make sure to change the columns in the 'row = [...]' line, as well to comment the unnecesary 'searcher' and 'extract' lines. Full header is shown in the next comment for further reference:
 # header = ['filename', Ir_1, Ir_2, Ir_3, 'E_1', 'E_2', 'E_3', 'E>'+str(threshold)+'?', 'E_73', 'E_74', 'E_75', 'E_76', 'Zero_E_Gamma_Point=(E_4++144)/2 [cm^-1]', 'Zero_E_Gamma_Point [eV]']
 header = ['filename', 'E_1', 'E_2', 'E_3', 'E>'+str(threshold)+'?', 'E_73', 'E_74', 'E_75', 'E_76', 'Zero_E_Gamma_Point=(E_4++'+str(data_lines_phonon)+')/2 [cm^-1]', 'Zero_E_Gamma_Point [eV]']
+# Type of each column of the header, for the tables of cr_table.py: 'float', 'category', 'bool' or 'text'
+types = ['text', 'float', 'float', 'float', 'bool', 'float', 'float', 'float', 'float', 'float', 'float']
 # Run the main script for *.phonon files at execution. Set to False to import the functions as a module.
 run_at_import = False
 # Rename the file_name in the xxx-xxx-xxx-xxx format; set to False to keep the original name
@@ -43,8 +46,8 @@ rename_files = False
 cry = 30
 # Omit, or not, all values from corrupted files
 safemode = False
-# Main program for reading phonon files. Change the default arguments to run the script from the command line
-def main(data_directory='data', data_phonon='cc-2_Efield.phonon', out='out_phonon.csv', out_error='errors_phonon.txt'):
+# Main program for reading phonon files. Change the default arguments to run the script from the command line. With 'table=True', the rows are also kept in memory as a cr_table.Table, which is returned. A 'budget' of seconds can be given for the whole job, as in cr.main_setup()
+def main(data_directory='data', data_phonon='cc-2_Efield.phonon', out='out_phonon.csv', out_error='errors_phonon.txt', workers=1, mmap_mode=False, cache=False, cache_clear=False, incremental=False, flush_interval=100, prefetch=0, index=False, stats=False, spectra=False, table=False, budget=False):
 ##################################################################
 
     print("")
@@ -55,127 +58,245 @@ def main(data_directory='data', data_phonon='cc-2_Efield.phonon', out='out_phono
         print("  If you find this code useful, a citation would be awesome :D")
         print("  Gila-Herranz, Pablo. “CrystalReader”, 2023. https://github.com/pablogila/CrystalReader")
     print("")
+
+    if cr.numpy() is None:
+        print("  ------------------------------------------------------------")
+        print("  ERROR:  Could not import the numpy module, needed to read")
+        print("  the .phonon files. Perform 'pip install --user numpy'")
+        print("  ------------------------------------------------------------")
+        print("")
+        return
     print("  data directory:      ", data_directory)
     print("  data files:          ", data_phonon)
     print("  output file:         ", out)
     print("  error log:           ", out_error)
     print("  abortion time:       ", cry)
+    print("  budget:              ", budget)
     print("  safemode:            ", safemode)
+    print("  workers:             ", workers)
+    print("  mmap mode:           ", mmap_mode)
+    print("  cache:               ", cache)
+    print("  incremental:         ", incremental)
+    print("  flush interval:      ", flush_interval)
+    print("  prefetch:            ", prefetch)
+    print("  index:               ", index)
+    print("  stats:               ", stats)
+    print("  full spectra:        ", spectra)
     print("  phonon lines:        ", data_lines_phonon)
     print("  threshold for E>0:   ", threshold)
     print("")
 
-    # Get the absolute path to the directory containing the Python script
-    dir_path = os.path.dirname(os.path.realpath(__file__))
-    # Specify the path to the directory containing the folders with the .castep files, relative to the script's directory
-    path = os.path.join(dir_path, data_directory)
-    # Get the names of all the directories in the given path, and store them in a list
-    directories = [d for d in os.listdir(path) if os.path.isdir(os.path.join(path, d))]
+    # Folders with the data files, the stats of the run and the deadline of the budget of the whole job
+    path, directories, data_phonon, run_stats, job_deadline = cr.main_setup(data_directory, data_phonon, out, index, stats, budget)
+
+    # Start a timer, for the final message
+    time_start = time.time()
+
+    # Read the file in each folder of the /data path. The row of each folder is extracted by read_directory()
+    reader = functools.partial(read_directory, path=path, data_phonon=data_phonon, cry=cry, safemode=safemode, rename_files=rename_files, threshold=threshold, data_lines_phonon=data_lines_phonon, mmap_mode=mmap_mode, budget=job_deadline)
+    # The results of previous runs are only reused if they were extracted with the same header and settings
+    fields = str([cr.version(), header, safemode, rename_files, threshold, data_lines_phonon])
+    rows = cr_table.Table(header, types) if table else None
+    messages = cr.main_loop(reader, directories, path, data_phonon, header, out, out_error, fields, workers, cache, cache_clear, incremental, flush_interval, prefetch, run_stats, rows)
+
+    time_elapsed = round(time.time() - time_start, 1)
+    print("")
+    print("  Finished reading the ", data_directory + "/.../" + data_phonon, " files in " + str(time_elapsed) + "s")
+    print("  Data extracted and saved to ", out)
+    for message in messages:
+        print("  " + message)
+    print("")
+
+    # Save all the frequencies of all the q-points, if requested
+    if spectra:
+        if spectra is True:
+            spectra = os.path.splitext(out)[0] + '_spectra.npz'
+        save_spectra(directories, path, data_phonon, spectra, workers)
+    return rows
+
+
+# Read the .phonon file of a single directory, returning the row of values and a list with the errors found.
+# It is called by main() for every directory, maybe from another process, so the parameters are passed as arguments
+def read_directory(directory, path, data_phonon, cry=cry, safemode=safemode, rename_files=rename_files, threshold=threshold, data_lines_phonon=data_lines_phonon, mmap_mode=False, budget=None):
+
+    # Define the path to the .phonon file
+    file_phonon = os.path.join(path, directory, data_phonon)
+
+    # Rename, or not, the file_name in the xxx-xxx-xxx-xxx format
+    if rename_files == True:
+        file_name = cr.naming(directory)
+    else:
+        file_name = directory
+
+    # Check if the file exists
+    if not cr.file_exists(file_phonon):
+        error = [file_name, 'missing file']
+        return None, [error]
+
+    return read_file(file_phonon, file_name, cry, safemode, threshold, data_lines_phonon, mmap_mode, budget)
+
+
+# Read a .phonon file, given by its name or as a binary file object, returning the row of values, starting with the 'file_name', and a list with the errors found.
+# The file gets 'cry' seconds, or less if the 'budget' of the job, given as a Deadline, ends before
+def read_file(file_phonon, file_name, cry=cry, safemode=safemode, threshold=threshold, data_lines_phonon=data_lines_phonon, mmap_mode=False, budget=None):
 
-    # Empty arrays to store the data
     errors = []
-    rows = []
-    rows.append(header)
+    deadline = cr.Deadline(cry, budget)
 
-    # Start a timer and counter, for the progress bar and warning messages
-    time_start = time.time()
-    bar = time_start
-    loop = 0
+    # Read the file and look for the desired line, return the corresponding lines after the match
+    # The phonon_str[0] is the header, the phonon_str[1] is the first line of data, etc.
+    phonon_str = cr.searcher_multi(file_phonon, {'q-pt=': data_lines_phonon}, deadline, mmap_mode)['q-pt=']
 
-    # Loop through all the folders in the /data path
-    for directory in directories:
+    # Report how far the search got if the time was over
+    if deadline.expired:
+        errors.append([file_name, ' ' + deadline.report()])
 
-        # Progress bar, just for fun
-        loop += 1
-        cr.progressbar(loop, len(directories), bar)
+    try:
+        # All the lines of the block are converted at once to an array of (modes x columns)
+        block = read_block(phonon_str[1:data_lines_phonon + 1])
+        frequencies = block[:, 1]
+        #intensities = block[:, 2]
+        if len(frequencies) < data_lines_phonon:
+            raise IndexError
+        #Ir_1, Ir_2, Ir_3 = intensities[0:3].tolist()
+        E_1, E_2, E_3 = frequencies[0:3].tolist()
+        E_73, E_74, E_75, E_76 = frequencies[72:76].tolist()
 
-        # Define the path to the .phonon file
-        file_phonon = os.path.join(path, directory, data_phonon)
+    except:
+        # ERROR:
+        error = [file_name, ' missing value/s', ' safemode = ' + str(safemode)]
+        errors.append(error)
+        row = [file_name]
+        return row, errors
 
-        # Check if the file exists
-        if not os.path.isfile(file_phonon):
-            error = [file_name, 'missing file']
-            errors.append(error)
-            continue
-
-        # Rename, or not, the file_name in the xxx-xxx-xxx-xxx format
-        if rename_files == True:
-            file_name = cr.naming(directory)
-        else:
-            file_name = directory
-
-        # Read the file and look for the desired line, return the corresponding lines after the match
-        # The phonon_str[0] is the header, the phonon_str[1] is the first line of data, etc.
-        phonon_str = cr.searcher(file_phonon, 'q-pt=', cry, data_lines_phonon)
-
-        try:
-            #Ir_1 = cr.extract_column(phonon_str[1], 2)
-            #Ir_2 = cr.extract_column(phonon_str[2], 2)
-            #Ir_3 = cr.extract_column(phonon_str[3], 2)
-            E_1 = cr.extract_column(phonon_str[1], 1)
-            E_2 = cr.extract_column(phonon_str[2], 1)
-            E_3 = cr.extract_column(phonon_str[3], 1)
-            E_73 = cr.extract_column(phonon_str[73], 1)
-            E_74 = cr.extract_column(phonon_str[74], 1)
-            E_75 = cr.extract_column(phonon_str[75], 1)
-            E_76 = cr.extract_column(phonon_str[76], 1)
-
-        except:
-            # ERROR:
-            error = [file_name, ' missing value/s', ' safemode = ' + str(safemode)]
+    # Check if the first energies are greater than the threshold
+    np = cr.numpy()
+    if np.any(np.abs(frequencies[0:3]) > threshold):
+        question = 'YES'
+    else:
+        question = 'no'
+
+    # Zero Energy at the Gamma Point, from the 4th mode on
+    ZEGP = float(frequencies[3:].sum()) / 2
+
+    ##################################################################
+    #       IF YOU MODIFIED THE HEADER, MODIFY THE COLUMNS TOO
+    ##################################################################
+    # Values to save. Full row in the following comment for further reference:
+    # row = [file_name, Ir_1, Ir_2, Ir_3, E_1, E_2, E_3, question, E_73, E_74, E_75, E_76, ZEGP, ZEGP * cr.cm_ev()]
+    row = [file_name, E_1, E_2, E_3, question, E_73, E_74, E_75, E_76, ZEGP, ZEGP * cr.cm_ev()]
+    ##################################################################
+
+    # ERRORS: Check if any of the values are missing. For 'phonon' files in particular it should be handled in the 'except' part, and should not be neccesary. However, we leave it here just in case.
+    error = [file_name, ' missing value/s', ' safemode = ' + str(safemode)]
+    for i, var in enumerate(row):
+        if var is None:
             errors.append(error)
-            bar = True
-            row = [file_name]
-            rows.append(row)
-            continue
-
-        # Check if the first energies are greater than the threshold
-        if (abs(E_1) > threshold) or (abs(E_2) > threshold) or (abs(E_3) > threshold):
-            question = 'YES'
-        else:
-            question = 'no'
-
-        ZEGP = 0
-        for k in range(4, data_lines_phonon + 1):
-            ZEGP += cr.extract_column(phonon_str[k], 1)
-        ZEGP = ZEGP/2
-
-        ##################################################################
-        #       IF YOU MODIFIED THE HEADER, MODIFY THE COLUMNS TOO
-        ##################################################################
-        # Values to save. Full row in the following comment for further reference:
-        # row = [file_name, Ir_1, Ir_2, Ir_3, E_1, E_2, E_3, question, E_73, E_74, E_75, E_76, ZEGP, ZEGP * cr.cm_ev()]
-        row = [file_name, E_1, E_2, E_3, question, E_73, E_74, E_75, E_76, ZEGP, ZEGP * cr.cm_ev()]
-        ##################################################################
-
-        # ERRORS: Check if any of the values are missing. For 'phonon' files in particular it should be handled in the 'except' part, and should not be neccesary. However, we leave it here just in case.
-        error = [file_name, ' missing value/s', ' safemode = ' + str(safemode)]
-        for i, var in enumerate(row):
-            if var is None:
-                errors.append(error)
-                bar = True
-                if safemode == True:
-                    row = [file_name]
-                break
+            if safemode == True:
+                row = [file_name]
+            break
 
-        rows.append(row)
+    return row, errors
 
-    print("")
 
-    # Save the data to a CSV file
-    df = pd.DataFrame(rows)
-    df.to_csv(out, header=False, index=False)
+# Convert the lines of a q-point block, with the same number of columns, to a 2D array of (lines x columns) in a single call.
+# Raises ValueError if any value is not a number or if the lines have a different number of columns
+def read_block(lines):
+    np = cr.numpy()
+    values = np.array(' '.join(lines).split(), dtype=float)
+    if len(lines) == 0 or len(values) % len(lines) != 0:
+        raise ValueError("the block lines have a different number of columns")
+    return values.reshape(len(lines), -1)
 
-    # Display and save errors and warnings
-    cr.errorlog(out_error, errors)
 
-    time_elapsed = round(time.time() - time_start, 1)
+# Read all the q-point blocks of a .phonon file. Returns a dict with the 'qpts' (q-points x 3) and 'weights' of the q-points, and the 'frequencies' and 'intensities' (q-points x modes) of the modes; the intensities are NaN if they are not in the file
+def read_spectrum(file_phonon):
+    np = cr.numpy()
+    qpts = []
+    weights = []
+    blocks = []
+    branches = None
+    with open(file_phonon, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if branches is None and line.startswith('Number of branches'):
+                branches = int(line.split()[-1])
+            elif line.startswith('q-pt='):
+                if branches is None:
+                    raise ValueError("'Number of branches' not found before the first q-point")
+                values = line.split()
+                qpts.append([float(x) for x in values[2:5]])
+                weights.append(float(values[5]))
+                blocks.append(read_block([f.readline() for i in range(branches)]))
+    if not blocks:
+        raise ValueError("no q-points found")
+    frequencies = np.array([block[:, 1] for block in blocks])
+    intensities = np.array([block[:, 2] if block.shape[1] > 2 else np.full(branches, np.nan) for block in blocks])
+    return {'qpts': np.array(qpts), 'weights': np.array(weights), 'frequencies': frequencies, 'intensities': intensities}
+
+
+# Read the full spectrum of the .phonon file of a single directory, returning the file name, the spectrum (or None) and a list with the errors found
+def read_directory_spectrum(directory, path, data_phonon, rename_files=rename_files):
+    file_phonon = os.path.join(path, directory, data_phonon)
+    if rename_files == True:
+        file_name = cr.naming(directory)
+    else:
+        file_name = directory
+    if not os.path.isfile(file_phonon):
+        return file_name, None, [[file_name, 'missing file']]
+    try:
+        return file_name, read_spectrum(file_phonon), []
+    except ValueError as error:
+        return file_name, None, [[file_name, ' corrupted spectrum: ' + str(error)]]
+
+
+# Save the full spectra of all the directories to a compressed NumPy .npz file, with the arrays:
+# 'filename' (structures), 'qpts' (structures x q-points x 3), 'weights' (structures x q-points), 'frequencies' and 'intensities' (structures x q-points x modes), and the number of 'n_qpts' and 'n_modes' of each structure.
+# Structures with fewer q-points or modes than the rest are filled with NaN. Load it back with load_spectra()
+def save_spectra(directories, path, data_phonon, out_spectra, workers=1):
+    np = cr.numpy()
+    print("  Reading the full spectra...")
+    time_start = time.time()
+    names = []
+    spectra = []
+    errors = []
+    loop = 0
+    reader = functools.partial(read_directory_spectrum, path=path, data_phonon=data_phonon, rename_files=rename_files)
+    for file_name, spectrum, file_errors in cr.pool_map(reader, directories, workers):
+        errors.extend(file_errors)
+        if spectrum is not None:
+            names.append(file_name)
+            spectra.append(spectrum)
+        loop += 1
+        cr.progressbar(loop, len(directories), time_start if not errors else True)
     print("")
-    print("  Finished reading the ", data_directory + "/.../" + data_phonon, " files in " + str(time_elapsed) + "s")
-    print("  Data extracted and saved to ", out)
+    n_qpts = np.array([len(spectrum['weights']) for spectrum in spectra], dtype=int)
+    n_modes = np.array([spectrum['frequencies'].shape[1] for spectrum in spectra], dtype=int)
+    shape = (len(spectra), max(n_qpts, default=0), max(n_modes, default=0))
+    arrays = {
+        'qpts': np.full(shape[:2] + (3,), np.nan),
+        'weights': np.full(shape[:2], np.nan),
+        'frequencies': np.full(shape, np.nan),
+        'intensities': np.full(shape, np.nan),
+    }
+    for i, spectrum in enumerate(spectra):
+        arrays['qpts'][i, :n_qpts[i]] = spectrum['qpts']
+        arrays['weights'][i, :n_qpts[i]] = spectrum['weights']
+        arrays['frequencies'][i, :n_qpts[i], :n_modes[i]] = spectrum['frequencies']
+        arrays['intensities'][i, :n_qpts[i], :n_modes[i]] = spectrum['intensities']
+    np.savez_compressed(out_spectra, filename=np.array(names, dtype=str), n_qpts=n_qpts, n_modes=n_modes, **arrays)
+    cr.errorlog(os.path.splitext(out_spectra)[0] + '_errors.txt', errors)
+    print("  Spectra of", len(spectra), "structures saved to ", out_spectra, "in", round(time.time() - time_start, 1), "s")
     print("")
 
 
+# Load the full spectra saved by save_spectra(), returning a dict with the arrays
+def load_spectra(filename):
+    np = cr.numpy()
+    with np.load(filename) as data:
+        return {key: data[key] for key in data.files}
+
+
 if run_at_import:
     main()
 
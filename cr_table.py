@@ -0,0 +1,364 @@
+"""
+CrystalReader Table. Keep the rows extracted from the files in memory as typed columns, to export them to CSV, Parquet or pandas.
+Copyright (C) 2023  Pablo Gila-Herranz
+If you find this code useful, a citation would be awesome :D
+Pablo Gila-Herranz, “CrystalReader”, 2023. https://github.com/pablogila/CrystalReader
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import cr_common as cr
+
+
+##################################################################
+#                PARAMETERS THAT YOU MAY MODIFY
+##################################################################
+# Rows allocated when a table is created. When they are full, the columns grow 'growth' times bigger
+initial_rows = 1024
+growth = 2
+# Rows kept as Python lists before they are added to the columns, all of them at once
+batch_rows = 4096
+# Rows converted to Python values at a time when writing a CSV file
+csv_chunk = 65536
+# Strings read as True and False in the 'bool' columns, such as the threshold flag of the phonon files. True and False are written back as the first of them
+true_strings = ['YES', 'yes', 'True', 'true']
+false_strings = ['no', 'NO', 'False', 'false']
+##################################################################
+
+
+# Column of floats, as a float64 array with NaN for the missing values. Strings are converted to floats, so the rows read from a previous CSV output can be added too
+class FloatColumn:
+    kind = 'float'
+
+    def __init__(self, capacity):
+        self.values = cr.numpy().full(capacity, float('nan'))
+
+    def resize(self, capacity, length):
+        values = cr.numpy().full(capacity, float('nan'))
+        values[:length] = self.values[:length]
+        self.values = values
+
+    # Save the 'values' of the rows from 'start' on. Raises ValueError or TypeError if any of them is not a number
+    def extend(self, start, values):
+        try:
+            # NumPy converts None to NaN, and the strings of numbers to floats
+            self.values[start:start + len(values)] = cr.numpy().array(values, dtype=float)
+        except (ValueError, TypeError):
+            self.values[start:start + len(values)] = [float('nan') if value is None or value == '' else float(value) for value in values]
+
+    # Python values of the rows from 'start' to 'stop', with None for the missing ones
+    def tolist(self, start, stop):
+        return [None if value != value else value for value in self.values[start:stop].tolist()]
+
+    # Python value of a single 'value', as tolist() would return it. Raises ValueError or TypeError if it does not fit the column
+    @staticmethod
+    def convert(value):
+        if value is None or value == '':
+            return None
+        value = float(value)
+        return None if value != value else value
+
+    def nbytes(self):
+        return self.values.nbytes
+
+    def to_pandas(self, length):
+        return self.values[:length]
+
+    def to_arrow(self, length):
+        import pyarrow
+        return pyarrow.array(self.values[:length], from_pandas=True)
+
+
+# Column with a few different values, such as the space groups, as int32 codes pointing to a list of 'categories', with -1 for the missing values
+class CategoryColumn:
+    kind = 'category'
+
+    def __init__(self, capacity):
+        self.codes = cr.numpy().full(capacity, -1, dtype='int32')
+        self.categories = []
+        self.index = {}
+
+    def resize(self, capacity, length):
+        codes = cr.numpy().full(capacity, -1, dtype='int32')
+        codes[:length] = self.codes[:length]
+        self.codes = codes
+
+    def code(self, value):
+        if value is None or value == '':
+            return -1
+        code = self.index.get(value)
+        if code is None:
+            code = self.index[value] = len(self.categories)
+            self.categories.append(value)
+        return code
+
+    def extend(self, start, values):
+        self.codes[start:start + len(values)] = [self.code(value) for value in values]
+
+    def tolist(self, start, stop):
+        return [None if code < 0 else self.categories[code] for code in self.codes[start:stop].tolist()]
+
+    @staticmethod
+    def convert(value):
+        return None if value == '' else value
+
+    def nbytes(self):
+        return self.codes.nbytes + sum(len(str(category)) for category in self.categories)
+
+    def to_pandas(self, length):
+        import pandas
+        return pandas.Categorical.from_codes(self.codes[:length], self.categories)
+
+    def to_arrow(self, length):
+        import pyarrow
+        codes = self.codes[:length]
+        return pyarrow.DictionaryArray.from_arrays(pyarrow.array(codes, mask=codes < 0), pyarrow.array(self.categories))
+
+
+# Column of yes/no values, as a boolean array and a mask of the missing values
+class BoolColumn:
+    kind = 'bool'
+
+    def __init__(self, capacity):
+        np = cr.numpy()
+        self.values = np.zeros(capacity, dtype=bool)
+        self.missing = np.ones(capacity, dtype=bool)
+
+    def resize(self, capacity, length):
+        np = cr.numpy()
+        values = np.zeros(capacity, dtype=bool)
+        missing = np.ones(capacity, dtype=bool)
+        values[:length] = self.values[:length]
+        missing[:length] = self.missing[:length]
+        self.values = values
+        self.missing = missing
+
+    def extend(self, start, values):
+        missing = [value is None or value == '' for value in values]
+        for value, is_missing in zip(values, missing):
+            if not is_missing and value is not True and value is not False and value not in true_strings and value not in false_strings:
+                raise ValueError(value)
+        self.values[start:start + len(values)] = [value is True or value in true_strings for value in values]
+        self.missing[start:start + len(values)] = missing
+
+    def tolist(self, start, stop):
+        strings = {True: true_strings[0], False: false_strings[0]}
+        return [None if missing else strings[value] for value, missing in zip(self.values[start:stop].tolist(), self.missing[start:stop].tolist())]
+
+    @staticmethod
+    def convert(value):
+        if value is None or value == '':
+            return None
+        if value is True or value in true_strings:
+            return true_strings[0]
+        if value is False or value in false_strings:
+            return false_strings[0]
+        raise ValueError(value)
+
+    def nbytes(self):
+        return self.values.nbytes + self.missing.nbytes
+
+    def to_pandas(self, length):
+        import pandas
+        return pandas.arrays.BooleanArray(self.values[:length], self.missing[:length])
+
+    def to_arrow(self, length):
+        import pyarrow
+        return pyarrow.array(self.values[:length], mask=self.missing[:length])
+
+
+# Column of strings, such as the filenames, stored one after the other as UTF-8 in a single byte array, with the 'offsets' where each one starts and ends, as in Arrow.
+# Any other value is saved as its string. A column turned into text from another 'kind' saves the values that fit that kind as they were written before, given by its 'convert' function, so that the text of a value does not depend on the batch it was added with
+class TextColumn:
+    kind = 'text'
+
+    def __init__(self, capacity, convert=None):
+        self.convert = convert
+        np = cr.numpy()
+        self.offsets = np.zeros(capacity + 1, dtype='int64')
+        self.missing = np.ones(capacity, dtype=bool)
+        self.data = np.zeros(capacity * 16, dtype='uint8')
+
+    def resize(self, capacity, length):
+        np = cr.numpy()
+        offsets = np.zeros(capacity + 1, dtype='int64')
+        missing = np.ones(capacity, dtype=bool)
+        offsets[:length + 1] = self.offsets[:length + 1]
+        missing[:length] = self.missing[:length]
+        self.offsets = offsets
+        self.missing = missing
+
+    def extend(self, start, values):
+        np = cr.numpy()
+        if self.convert is not None:
+            values = [self.previous_form(value) for value in values]
+        encoded = [b'' if value is None else str(value).encode('utf-8') for value in values]
+        begin = int(self.offsets[start])
+        data = b''.join(encoded)
+        end = begin + len(data)
+        # The byte array also grows 'growth' times bigger when it is full
+        if end > len(self.data):
+            grown = np.zeros(max(len(self.data) * growth, end), dtype='uint8')
+            grown[:begin] = self.data[:begin]
+            self.data = grown
+        self.data[begin:end] = np.frombuffer(data, dtype='uint8')
+        self.offsets[start + 1:start + len(values) + 1] = begin + np.cumsum([len(value) for value in encoded])
+        self.missing[start:start + len(values)] = [value is None for value in values]
+
+    # Value as written by the column that was turned into text, or the value itself if it did not fit that column
+    def previous_form(self, value):
+        try:
+            return self.convert(value)
+        except (ValueError, TypeError):
+            return value
+
+    def tolist(self, start, stop):
+        data = self.data[self.offsets[start]:self.offsets[stop]].tobytes()
+        offsets = (self.offsets[start:stop + 1] - self.offsets[start]).tolist()
+        return [None if missing else data[offsets[i]:offsets[i + 1]].decode('utf-8') for i, missing in enumerate(self.missing[start:stop].tolist())]
+
+    def nbytes(self):
+        return self.offsets.nbytes + self.missing.nbytes + self.data.nbytes
+
+    def to_pandas(self, length):
+        return cr.numpy().array(self.tolist(0, length), dtype=object)
+
+    def to_arrow(self, length):
+        import pyarrow
+        np = cr.numpy()
+        validity = np.packbits(~self.missing[:length], bitorder='little')
+        buffers = [pyarrow.py_buffer(validity), pyarrow.py_buffer(self.offsets[:length + 1]), pyarrow.py_buffer(self.data[:self.offsets[length]])]
+        return pyarrow.Array.from_buffers(pyarrow.large_string(), length, buffers, null_count=int(self.missing[:length].sum()))
+
+
+# Columns for each type
+column_kinds = {'float': FloatColumn, 'category': CategoryColumn, 'bool': BoolColumn, 'text': TextColumn}
+
+
+# Type of a column guessed from its first value: 'float' for numbers, 'bool' for True and False, and 'text' for anything else
+def guess_type(value):
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, (int, float)):
+        return 'float'
+    return 'text'
+
+
+# Table of rows with typed columns, used instead of a list of rows to keep the values of many files in memory.
+# 'types' is a list with the type of each column of the 'header': 'float', 'category', 'bool' or 'text', as the 'types' of the cif and phonon scripts, or None to guess it from its first value.
+# The rows are added to the columns 'batch_rows' at a time. The columns are allocated for 'capacity' rows, and grow 'growth' times bigger when they are full. A value that does not fit the type of its column, such as a string in a 'float' column, turns the column into 'text'. Requires NumPy
+class Table:
+
+    def __init__(self, header, types=None, capacity=initial_rows):
+        self.header = list(header)
+        self.types = list(types) if types is not None else [None] * len(self.header)
+        self.length = 0
+        self.capacity = max(capacity, 1)
+        # The columns with no type are created with their first value
+        self.columns = [column_kinds[kind](self.capacity) if kind else None for kind in self.types]
+        # Rows waiting to be added to the columns
+        self.batch = []
+
+    def __len__(self):
+        return self.length + len(self.batch)
+
+    # Add a row, as the ones returned by the read_directory() functions. Shorter rows are filled with missing values
+    def append(self, row):
+        if len(row) > len(self.header):
+            raise ValueError("the row has more values than the header")
+        self.batch.append(row)
+        if len(self.batch) >= batch_rows:
+            self.flush()
+
+    # Add the rows of the batch to the columns
+    def flush(self):
+        if not self.batch:
+            return
+        count = len(self.batch)
+        if self.length + count > self.capacity:
+            while self.length + count > self.capacity:
+                self.capacity *= growth
+            for column in self.columns:
+                if column is not None:
+                    column.resize(self.capacity, self.length)
+        width = len(self.header)
+        values = list(zip(*[row if len(row) == width else list(row) + [None] * (width - len(row)) for row in self.batch]))
+        for j, column_values in enumerate(values):
+            column = self.columns[j]
+            if column is None:
+                first = next((value for value in column_values if value is not None), None)
+                if first is None:
+                    continue
+                column = self.columns[j] = column_kinds[guess_type(first)](self.capacity)
+            try:
+                column.extend(self.length, column_values)
+            except (ValueError, TypeError):
+                self.columns[j] = self.to_text(column)
+                self.columns[j].extend(self.length, column_values)
+        self.length += count
+        self.batch = []
+
+    # Copy of a column as a 'text' column, which writes the values of the next rows as the column did
+    def to_text(self, column):
+        text = TextColumn(self.capacity, type(column).convert)
+        text.extend(0, column.tolist(0, self.length))
+        return text
+
+    # Type of each column, with None for the ones without values yet
+    def kinds(self):
+        self.flush()
+        return [column.kind if column is not None else None for column in self.columns]
+
+    # Bytes used by the columns
+    def nbytes(self):
+        self.flush()
+        return sum(column.nbytes() for column in self.columns if column is not None)
+
+    # Yield the rows as lists of Python values, with None for the missing values, converting 'csv_chunk' rows at a time
+    def rows(self):
+        self.flush()
+        for start in range(0, self.length, csv_chunk):
+            stop = min(start + csv_chunk, self.length)
+            columns = [column.tolist(start, stop) if column is not None else [None] * (stop - start) for column in self.columns]
+            yield from (list(row) for row in zip(*columns))
+
+    # Write the table to a CSV file, in the same format as the output of the jobs
+    def to_csv(self, filename, flush_interval=csv_chunk):
+        writer = cr.StreamWriter(filename, len(self.header), flush_interval)
+        writer.write(self.header)
+        for row in self.rows():
+            writer.write(row)
+        writer.close()
+
+    # pandas DataFrame with the columns of the table. The 'float' columns and the codes of the 'category' columns are not copied, but the strings of the 'text' columns are. Requires pandas
+    def to_dataframe(self):
+        import pandas
+        self.flush()
+        data = {}
+        for name, column in zip(self.header, self.columns):
+            data[name] = column.to_pandas(self.length) if column is not None else cr.numpy().full(self.length, None, dtype=object)
+        return pandas.DataFrame(data, copy=False)
+
+    # Arrow table with the columns of the table, without copying them, except for the masks of the missing values. Requires pyarrow
+    def to_arrow(self):
+        import pyarrow
+        self.flush()
+        arrays = [column.to_arrow(self.length) if column is not None else pyarrow.nulls(self.length) for column in self.columns]
+        return pyarrow.Table.from_arrays(arrays, names=self.header)
+
+    # Write the table to a Parquet file. Requires pyarrow
+    def to_parquet(self, filename):
+        import pyarrow.parquet
+        pyarrow.parquet.write_table(self.to_arrow(), filename)